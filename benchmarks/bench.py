@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+"""
+Benchmarks dilla against an in-memory SQLite database, using the models in
+benchapp (wide, ForeignKey heavy, many to many heavy and image models).
+
+Reports values/sec for every generate_* and column_* generator, rows/sec
+and query counts for populating each model with the dilla command, and the
+peak memory of the process. Results are written to a JSON file, and can be
+compared with the results of an earlier run. Exits with status 1 when a
+model doesn't get all its rows, so the benchmark doubles as a smoke test.
+
+Usage:
+    python benchmarks/bench.py [--iter 1000] [--batch-size 500] [--output bench.json] [--compare old.json]
+"""
+import os,sys,time,tempfile,resource
+from StringIO import StringIO
+from optparse import OptionParser
+
+BENCH_ROOT=os.path.dirname(os.path.abspath(__file__))
+DILLA_ROOT=os.path.dirname(BENCH_ROOT)
+#dilla is installed under the name of its checkout directory
+DILLA_APP=os.path.basename(DILLA_ROOT)
+sys.path.insert(0,BENCH_ROOT)
+sys.path.insert(0,os.path.dirname(DILLA_ROOT))
+
+from django.conf import settings
+settings.configure(
+    DEBUG=True,
+    DATABASE_ENGINE='sqlite3',
+    DATABASE_NAME=':memory:',
+    INSTALLED_APPS=(DILLA_APP,'benchapp'),
+    MEDIA_ROOT=tempfile.mkdtemp(prefix='dilla-bench-')+'/',
+    SECRET_KEY='dilla-benchmarks',
+)
+
+from django.core.management import call_command
+from django.db.models import get_app,get_models,URLField
+from django.utils import simplejson
+import django
+
+dilla=__import__('%s.management.commands.dilla'%DILLA_APP,{},{},['Command'])
+
+GENERATOR_HELPERS=('hashkey','uuid','zip','extended_zip','phonenumber','sip_URI')
+
+def peak_memory():
+    """
+    Peak resident memory of the process so far, in kilobytes
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def rate(count,elapsed):
+    return count/max(elapsed,0.000001)
+
+def bench_population(iterations,batch_size,seed):
+    """
+    Populates every benchapp model in DillaController order with the dilla
+    command, and measures rows/sec for each one. Queries are summed from
+    the JSON metrics the command reports.
+    """
+    app=get_app('benchapp')
+    results={}
+    stdout=sys.stdout
+    for name in app.DillaController.models:
+        model=getattr(app,name)
+        before=model._default_manager.count()
+        output=StringIO()
+        sys.stdout=output
+        try:
+            started=time.time()
+            call_command('dilla','benchapp',models=[name],iterations=str(iterations),batch_size=str(batch_size),seed=str(seed),progress='0',metrics='json')
+            elapsed=time.time()-started
+        finally:
+            sys.stdout=stdout
+        queries=0
+        for line in output.getvalue().splitlines():
+            if not line.startswith('{'): continue
+            event=simplejson.loads(line)
+            if event['event']=='done': queries+=event['queries'] or 0
+        rows=model._default_manager.count()-before
+        results['benchapp.%s'%name]={
+            'rows':rows,
+            'seconds':elapsed,
+            'rows_per_sec':rate(rows,elapsed),
+            'queries':queries,
+        }
+    return results
+
+def bench_generators(count):
+    """
+    Calls every generate_* method count times, and every column_* method
+    once for count values, on a field of the matching type
+    """
+    dilla.load_numpy()
+    command=dilla.Command()
+    fields={}
+    for model in get_models(get_app('benchapp')):
+        for field in model._meta.fields:
+            if field.auto_created: continue
+            if isinstance(field,URLField): fields.setdefault('URLField',field)
+            else: fields.setdefault(field.get_internal_type(),field)
+    results={}
+    for name in sorted(dir(command)):
+        if name.startswith('generate_') or name.startswith('column_'):
+            field=fields.get(name.split('_',1)[1],None)
+            if not field: continue
+            kwargs=dict(field=field,unique=field.unique,max_length=field.max_length,field_extras=None)
+        elif name in GENERATOR_HELPERS:
+            kwargs={}
+        else:
+            continue
+        method=getattr(command,name)
+        started=time.time()
+        if name.startswith('column_'):
+            method(count,**kwargs)
+        else:
+            for i in xrange(count): method(**kwargs)
+        elapsed=time.time()-started
+        results[name]={'values':count,'seconds':elapsed,'values_per_sec':rate(count,elapsed)}
+    if dilla.load_images():
+        count=max(count/100,1)
+        started=time.time()
+        for i in xrange(count): command._generate_image('64x64')
+        elapsed=time.time()-started
+        results['_generate_image']={'values':count,'seconds':elapsed,'values_per_sec':rate(count,elapsed)}
+    return results
+
+def compare(results,previous):
+    """
+    Prints the ratio of every rate to the one of an earlier run
+    """
+    print "\nCompared to the previous run (>1.00 is faster):"
+    for section,key in (('generators','values_per_sec'),('population','rows_per_sec')):
+        for name in sorted(results[section].keys()):
+            old=previous.get(section,{}).get(name,None)
+            if not old or not old.get(key,None): continue
+            print "  %-40s %6.2fx" % (name,results[section][name][key]/old[key])
+    old_memory=previous.get('peak_memory_kb',None)
+    if old_memory: print "  %-40s %6.2fx" % ('peak memory',float(results['peak_memory_kb'])/old_memory)
+
+def main():
+    parser=OptionParser(usage="python %prog [options]")
+    parser.add_option('--iter','-i',default=1000,type='int',dest='iterations',help='Rows per model. Default is 1000.')
+    parser.add_option('--batch-size','-b',default=500,type='int',dest='batch_size',help='dilla --batch-size. Default is 500.')
+    parser.add_option('--generator-iter',default=5000,type='int',dest='generator_iterations',help='Values per generator. Default is 5000.')
+    parser.add_option('--seed',default=1,type='int',dest='seed',help='dilla --seed. Default is 1.')
+    parser.add_option('--output','-o',default='bench.json',dest='output',help='Write results to this JSON file. Default is bench.json.')
+    parser.add_option('--compare','-c',dest='compare',help='Compare results with this earlier JSON file.')
+    options,args=parser.parse_args()
+    call_command('syncdb',verbosity=0,interactive=False)
+    stdout=sys.stdout
+    #the command reports on its own, keep the benchmark output readable
+    sys.stdout=open(os.devnull,'w')
+    try:
+        population=bench_population(options.iterations,options.batch_size,options.seed)
+        generators=bench_generators(options.generator_iterations)
+    finally:
+        sys.stdout=stdout
+    results={
+        'meta':{
+            'python':sys.version.split()[0],
+            'django':django.get_version(),
+            'numpy':dilla.load_numpy(),
+            'iterations':options.iterations,
+            'batch_size':options.batch_size,
+            'generator_iterations':options.generator_iterations,
+            'seed':options.seed,
+            'time':time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'generators':generators,
+        'population':population,
+        'peak_memory_kb':peak_memory(),
+    }
+    print "Generators:"
+    for name in sorted(generators.keys()):
+        print "  %-40s %12.1f values/sec" % (name,generators[name]['values_per_sec'])
+    print "Population:"
+    for name in sorted(population.keys()):
+        result=population[name]
+        print "  %-40s %12.1f rows/sec %8d queries" % (name,result['rows_per_sec'],result['queries'])
+    print "Peak memory: %d KB" % results['peak_memory_kb']
+    incomplete=[name for name in sorted(population.keys()) if population[name]['rows']!=options.iterations]
+    output=open(options.output,'w')
+    simplejson.dump(results,output,indent=2,sort_keys=True)
+    output.close()
+    print "Results written to %s" % options.output
+    if options.compare:
+        previous=simplejson.load(open(options.compare))
+        compare(results,previous)
+    if incomplete:
+        print "\nMissing rows: %s" % ", ".join(["%s (%d/%d)" % (name,population[name]['rows'],options.iterations) for name in incomplete])
+        sys.exit(1)
+
+if __name__=='__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Representative models for the dilla benchmarks: a wide model, a
+ForeignKey heavy one, a many to many heavy one and one with images.
+"""
+from django.db import models
+
+class DillaController():
+    models=('Author','Tag','Wide','Article','Photo','Bundle')
+
+class Author(models.Model):
+    name=models.CharField(max_length=100)
+    email=models.EmailField()
+    slug=models.SlugField()
+    homepage=models.URLField()
+    ip=models.IPAddressField()
+    bio=models.TextField(blank=True)
+
+class Tag(models.Model):
+    name=models.CharField(max_length=50,unique=True)
+
+class Wide(models.Model):
+    """
+    44 columns, ten of each common type plus a few others
+    """
+    created=models.DateTimeField()
+    opens=models.TimeField()
+    active=models.BooleanField()
+    notes=models.TextField()
+
+for i in range(10):
+    Wide.add_to_class('char_%d'%i,models.CharField(max_length=64))
+    Wide.add_to_class('int_%d'%i,models.IntegerField())
+    Wide.add_to_class('small_%d'%i,models.PositiveSmallIntegerField())
+    Wide.add_to_class('price_%d'%i,models.DecimalField(decimal_places=2,max_digits=7))
+
+class Article(models.Model):
+    author=models.ForeignKey(Author,related_name='articles')
+    editor=models.ForeignKey(Author,related_name='edited_articles')
+    tag=models.ForeignKey(Tag)
+    wide=models.ForeignKey(Wide)
+    parent=models.ForeignKey('self',null=True,blank=True)
+    title=models.CharField(max_length=200)
+    body=models.TextField()
+    published=models.DateTimeField()
+    views=models.PositiveIntegerField()
+
+    class Dilla():
+        field_extras={
+            'published':{'day_delta':365,'hour_delta':24},
+            'views':{'integer_range':(0,100000)},
+            'body':{'paragraph_range':(1,4)},
+        }
+
+class Photo(models.Model):
+    title=models.CharField(max_length=100)
+    image=models.CharField(max_length=255,null=True)
+
+    class Dilla():
+        generate_images=True
+        image_fields=('image',)
+        resolutions=('64x64','32x48')
+
+class Bundle(models.Model):
+    name=models.CharField(max_length=100)
+    tags=models.ManyToManyField(Tag)
+    articles=models.ManyToManyField(Article)
+
+    class Dilla():
+        field_extras={
+            'tags':{'max':10},
+            'articles':{'max':20},
+        }
@@ -1,13 +1,17 @@
-import random,string,datetime,os,re,time
+import random,string,datetime,os,time,sys,hashlib,tempfile,shutil,threading,Queue,itertools,gzip,csv
+import cPickle as pickle
+from array import array
 from decimal import Decimal
 from django.core.exceptions import ValidationError
 from optparse import make_option
-from django.contrib.webdesign.lorem_ipsum import words,paragraphs
+from django.contrib.webdesign.lorem_ipsum import paragraph,WORDS,COMMON_P
 from django.core.management.base import BaseCommand
-from django.db.models import get_app,get_models,URLField
+from django.core.management.color import no_style
+from django.db.models import get_app,get_models,URLField,AutoField,ForeignKey,ManyToManyField,Max
 from django.conf import settings
-import MySQLdb
-from django.db import connection
+from django.db import connection,transaction,reset_queries,IntegrityError
+from django.utils import simplejson
+from django.utils.importlib import import_module
 
 #Authors:
 #Adam Rutkowski <adam@mtod.org>
@@ -19,8 +23,12 @@ EXAMPLE
 models.py:
 
 class DillaController():
-    #(Optional) this defines the order of how models are populated. (Fixes cross ForeignKey problems)
+    #(Optional) the models to populate. They are ordered by their ForeignKeys anyway.
     models=('UserProfile','Venue','Event','Genre','Artist')
+    #(Optional) rows per unit of --scale, models without a ratio get --iter rows
+    ratios={'Venue':1,'Event':20,'Artist':5}
+    #(Optional) related rows per row of a many to many field, a number or a (min,max) range
+    fan_out={'Event.artists':(1,4)}
 
 class Event(models.Model):
     venue=models.ForeignKey('Venue')
@@ -43,6 +51,8 @@ class Event(models.Model):
                 'generator':None, #can point to a callable, which must return the desired value. If this is a string, it looks for a method in the dilla.py file.
                 'generator_wants_extras':False, #whether or not to pass this "field extra" hash item to the callable
                 'random_values':("word","yes","no","1"), #choose a random value from this tuple
+                'weights':(5,3,1,1), #with random_values, how often each value is chosen relative to the others
+                'distribution':'zipf', #'uniform', 'zipf', 'normal' or 'exponential', or a tuple with the parameters: ('zipf',1.2). For integer fields, day_delta, ForeignKeys and random_values.
                 'resolution':'1024x768', #if images, use this image size for this field
                 'resolutions':('300x340','200x190','100x10','200x90'), #if images, use a random size from this tuple
                 'max':10, #for many to many fields, the maximum associated objects will be 10, so it will take a range like: Model.objects.all().order_by("?")[0:random.randrange(0,max)]
@@ -62,24 +72,657 @@ class Event(models.Model):
 
 """
 
-image_support=False
-try:
-    import Image,ImageDraw,ImageFont
-    ROOT=os.path.split(__file__)[0]+"/../"
-    FAKE_UPLOAD_RELATIVE="dilla-fakes/"
+#numpy, PIL and the upload directory are only set up when a run needs them,
+#Django imports this module just to list or describe the commands
+numpy=None
+numpy_support=False
+
+def load_numpy():
+    """
+    Imports numpy on first use, returns whether it's installed
+    """
+    global numpy,numpy_support
+    if numpy is None:
+        try:
+            import numpy as module
+            numpy,numpy_support=module,True
+        except ImportError:
+            numpy=False
+    return numpy_support
+
+ROOT=os.path.split(__file__)[0]+"/../"
+FAKE_UPLOAD_RELATIVE="dilla-fakes/"
+fonts=['Besmellah_1.ttf','skullz.ttf','bonohadavision.ttf','openlogos.ttf', 'invaders.from.space.[fontvir.us].ttf','anim____.ttf']
+#loaded fonts by (font file,size), parsing a TTF is the slowest part of drawing an image
+font_cache={}
+image_support=None
+
+def load_images():
+    """
+    Imports PIL and creates the fake upload directory on first use, returns
+    whether images can be generated
+    """
+    global image_support,Image,ImageDraw,ImageFont,FAKE_UPLOAD_PATH,TTF_ENCODING
+    if image_support is not None: return image_support
+    image_support=False
+    try:
+        try:
+            from PIL import Image,ImageDraw,ImageFont
+        except ImportError:
+            import Image,ImageDraw,ImageFont
+    except ImportError, e:
+        print 'Images not supported, something went wrong: %s' % e
+        return False
     FAKE_UPLOAD_PATH="%s%s"%(settings.MEDIA_ROOT,FAKE_UPLOAD_RELATIVE)
     #armn(Apple Roman),ADBE(Adobe Expert),ADOB(Adobe Standard),symb(Microsoft Symbol),unic(Unicode),armn(TTF_ENCODING)
     TTF_ENCODING=getattr(settings,'TTF_ENCODING','armn')
     if not os.path.exists(FAKE_UPLOAD_PATH):os.makedirs(FAKE_UPLOAD_PATH)
-    fonts=['Besmellah_1.ttf','skullz.ttf','bonohadavision.ttf','openlogos.ttf', 'invaders.from.space.[fontvir.us].ttf','anim____.ttf']
     image_support=True
-except ImportError, e:
-    print 'Images not supported, something went wrong: %s' % e
-    
+    return True
+
 confirm_message="""Are you sure you want to run Dilla? 
 It will add a lot of random data to your database %s@%s.
 Type 'yes' to confirm.
-"""%(settings.DATABASE_USER,settings.DATABASE_NAME)
+"""
+
+#how many times a value (or a row, for unique_together) is regenerated before giving up on it
+UNIQUE_ATTEMPTS=20
+UNIQUE_INTEGER_TYPES=('IntegerField','PositiveIntegerField','SmallIntegerField','PositiveSmallIntegerField')
+UNIQUE_STRING_TYPES=('CharField','SlugField','EmailField','TextField')
+
+#'distribution' field extras, with their default parameters (relative to the range drawn from)
+DISTRIBUTIONS={'uniform':(),'zipf':(1.0,),'normal':(0.5,0.15),'exponential':(0.2,)}
+
+#backends taking INSERT ... VALUES (...),(...), and the most parameters SQLite takes in a statement
+MULTI_ROW_ENGINES=('mysql','postgresql','postgresql_psycopg2','sqlite3')
+SQLITE_MAX_VARIABLES=999
+INTEGER_KEY_TYPES=('AutoField','ForeignKey','OneToOneField','IntegerField','PositiveIntegerField','SmallIntegerField','PositiveSmallIntegerField')
+
+def key_array(field):
+    """
+    Returns an empty compact array for the values of a key field, or a list
+    when they aren't integers
+    """
+    if field.get_internal_type() in INTEGER_KEY_TYPES: return array('l')
+    return []
+
+def has_intermediary(field):
+    """
+    Whether a many to many field goes through a model of its own. Django 1.1
+    only sets rel.through for those, later versions auto-create a through
+    model for every many to many.
+    """
+    through=getattr(field.rel,'through',None)
+    if not through: return False
+    if isinstance(through,basestring): return True
+    return not getattr(through._meta,'auto_created',False)
+
+def base36(number):
+    """
+    Short lowercase representation of a positive integer
+    """
+    digits=string.digits+string.ascii_lowercase
+    result=''
+    while True:
+        number,digit=divmod(number,36)
+        result=digits[digit]+result
+        if not number: return result
+
+class DillaRandom(random.Random):
+    """
+    The random stream every generator draws from, with a numpy RandomState
+    alongside. stream(*key) reseeds both in place from the master seed and
+    key alone, so each model, batch or worker shard gets an independent
+    stream, and any of them is regenerated identically in isolation.
+    split(*key) returns such a stream as a new object.
+    """
+    def __init__(self,master=None):
+        if master is None: master=random.getrandbits(62)
+        self.master=master
+        self.numpy_seed=master%4294967296
+        self.numpy_state=None
+        random.Random.__init__(self,master)
+
+    def derive(self,*key):
+        """
+        Returns the seed of the stream of key
+        """
+        return int(hashlib.sha1(repr((self.master,)+key)).hexdigest()[:15],16)
+
+    def stream(self,*key):
+        seed=self.derive(*key)
+        self.seed(seed)
+        self.numpy_seed=seed%4294967296
+        if self.numpy_state is not None: self.numpy_state.seed(self.numpy_seed)
+        return self
+
+    def split(self,*key):
+        return DillaRandom(self.derive(*key))
+
+    def _numpy(self):
+        if self.numpy_state is None: self.numpy_state=numpy.random.RandomState(self.numpy_seed)
+        return self.numpy_state
+    numpy=property(_numpy)
+
+class PkPool(object):
+    """
+    Primary keys (or any key column) of one model, loaded once per run into
+    a compact array and sampled in O(1) from rng. With a limit, the pool
+    keeps a reservoir sample of that size instead of every key in the table,
+    on a stream of its own since keys are added by the writer threads.
+    Without load, the pool starts empty and only holds the keys added.
+    """
+    def __init__(self,model,field_name=None,limit=0,rng=None,load=True):
+        meta=model._meta
+        if not field_name: field_name=meta.pk.name
+        self.field_name=field_name
+        self.limit=limit
+        if rng is None: rng=DillaRandom()
+        self.rng=rng
+        self.reservoir=rng.split('reservoir',meta.app_label,meta.object_name,field_name)
+        self.seen=0
+        self.pks=key_array(meta.get_field(field_name))
+        keys=[]
+        #samples are drawn by position, which needs the same order every time
+        if load: keys=model._default_manager.order_by(field_name).values_list(field_name,flat=True).iterator()
+        if limit: self.extend(keys)
+        else:
+            self.pks.extend(keys)
+            self.seen=len(self.pks)
+
+    def __len__(self):
+        return len(self.pks)
+
+    def add(self,pk):
+        """
+        Adds a key, replacing a random one once a bounded pool is full
+        """
+        self.seen+=1
+        if not self.limit or len(self.pks)<self.limit:
+            self.pks.append(pk)
+            return
+        i=self.reservoir.randrange(0,self.seen)
+        if i<self.limit: self.pks[i]=pk
+
+    def extend(self,pks):
+        for pk in pks: self.add(pk)
+
+    def sample(self,distribution=None):
+        """
+        Returns a random key, or None if the pool is empty. Keys are drawn
+        uniformly, or with a Distribution over their position in the pool.
+        """
+        if not self.pks: return None
+        if distribution: return self.pks[distribution.index(len(self.pks))]
+        return self.pks[self.rng.randrange(0,len(self.pks))]
+
+class RangePool(object):
+    """
+    Key pool of consecutive integer keys handed out from first on, as
+    --output does for AutoFields: constant memory however many keys
+    """
+    def __init__(self,first=1,rng=None):
+        self.first=first
+        self.count=0
+        if rng is None: rng=DillaRandom()
+        self.rng=rng
+
+    def __len__(self):
+        return self.count
+
+    def _pks(self):
+        return xrange(self.first,self.first+self.count)
+    pks=property(_pks)
+
+    def extend(self,pks):
+        self.count+=len(pks)
+
+    def sample(self,distribution=None):
+        if not self.count: return None
+        if distribution: return self.first+distribution.index(self.count)
+        return self.first+self.rng.randrange(0,self.count)
+
+class AliasTable(object):
+    """
+    Weighted choice of an index in O(1), with Vose's alias method: one
+    uniform index and one uniform float per draw, whatever the weights.
+    """
+    def __init__(self,weights,rng):
+        self.rng=rng
+        n=len(weights)
+        total=float(sum(weights))
+        scaled=[w*n/total for w in weights]
+        self.prob=[1.0]*n
+        self.alias=range(n)
+        small=[i for i in range(n) if scaled[i]<1.0]
+        large=[i for i in range(n) if scaled[i]>=1.0]
+        while small and large:
+            less=small.pop()
+            more=large.pop()
+            self.prob[less]=scaled[less]
+            self.alias[less]=more
+            scaled[more]=scaled[more]+scaled[less]-1.0
+            if scaled[more]<1.0: small.append(more)
+            else: large.append(more)
+
+    def sample(self):
+        i=self.rng.randrange(0,len(self.prob))
+        if self.rng.random()<self.prob[i]: return i
+        return self.alias[i]
+
+class Distribution(object):
+    """
+    Draws indexes in [0,n) for the 'distribution' field extra, in O(1) and
+    without tables, so n can grow between draws (key pools do):
+    'zipf' or ('zipf',s): index i is drawn about (i+1)**-s times as often
+        as index 0, by inverting the continuous power law CDF.
+    'normal' or ('normal',mean,stddev): mean and stddev are fractions of n,
+        draws out of the range are clipped to it.
+    'exponential' or ('exponential',mean): mean is a fraction of n, draws
+        out of the range wrap around.
+    """
+    def __init__(self,spec,rng):
+        self.rng=rng
+        if isinstance(spec,basestring): spec=(spec,)
+        self.name=spec[0]
+        if self.name not in DISTRIBUTIONS:
+            print "Unknown distribution %s, using uniform" % self.name
+            self.name='uniform'
+        self.params=tuple([float(param) for param in tuple(spec[1:])+DISTRIBUTIONS[self.name][len(spec)-1:]])
+
+    def index(self,n):
+        if self.name=='zipf':
+            s=self.params[0]
+            if s==1: x=(n+1)**self.rng.random()
+            else: x=(((n+1)**(1-s)-1)*self.rng.random()+1)**(1/(1-s))
+            return min(int(x)-1,n-1)
+        if self.name=='normal':
+            return min(max(int(self.rng.gauss(self.params[0]*n,self.params[1]*n)),0),n-1)
+        if self.name=='exponential':
+            return int(self.rng.expovariate(1/(self.params[0]*n)))%n
+        return self.rng.randrange(0,n)
+
+    def column(self,n,count):
+        """
+        Draws count indexes at once, as a numpy array when numpy is there
+        """
+        if not numpy_support: return [self.index(n) for i in xrange(count)]
+        if self.name=='zipf':
+            s=self.params[0]
+            u=self.rng.numpy.random_sample(count)
+            if s==1: x=numpy.power(n+1,u)
+            else: x=numpy.power(((n+1)**(1-s)-1)*u+1,1/(1-s))
+            return numpy.minimum(x.astype(int)-1,n-1)
+        if self.name=='normal':
+            return numpy.clip(self.rng.numpy.normal(self.params[0]*n,self.params[1]*n,count).astype(int),0,n-1)
+        if self.name=='exponential':
+            return self.rng.numpy.exponential(self.params[0]*n,count).astype(int)%n
+        return self.rng.numpy.randint(0,n,count)
+
+class LoremCorpus(object):
+    """
+    The lorem ipsum words and a pool of pre-generated paragraphs, built once
+    per run, so text values only take index sampling and a join instead of
+    a lorem_ipsum.words() or paragraphs() call each.
+    The pool holds settings.DILLA_PARAGRAPH_POOL paragraphs, 200 by default.
+    lorem_ipsum draws from the random module, which is seeded from a stream
+    of the pool's own while building it, so every shard or resumed run of a
+    seed builds the same pool whichever batch needs text first.
+    """
+    def __init__(self,pool_size=None,rng=None):
+        if pool_size is None: pool_size=getattr(settings,'DILLA_PARAGRAPH_POOL',200)
+        if rng is None: rng=DillaRandom()
+        self.rng=rng
+        self.vocabulary=list(WORDS)
+        state=random.getstate()
+        random.seed(rng.derive('lorem'))
+        try: self.pool=[paragraph() for i in range(pool_size)]
+        finally: random.setstate(state)
+
+    def words(self,count):
+        """
+        Returns count random words separated by spaces
+        """
+        vocabulary=self.vocabulary
+        size=len(vocabulary)
+        rand=self.rng.random
+        return u' '.join([vocabulary[int(rand()*size)] for i in xrange(count)])
+
+    def word(self):
+        return self.vocabulary[int(self.rng.random()*len(self.vocabulary))]
+
+    def paragraphs(self,count):
+        """
+        Returns count paragraphs, starting with the common 'Lorem ipsum' one
+        like lorem_ipsum.paragraphs() does
+        """
+        if count<=0: return []
+        pool=self.pool
+        size=len(pool)
+        rand=self.rng.random
+        return [COMMON_P]+[pool[int(rand()*size)] for i in xrange(count-1)]
+
+class Metrics(object):
+    """
+    Rows, queries and time spent on one stage of a run (inserting a model,
+    filling a many to many field...). Reports progress every interval
+    seconds, as text lines or as JSON objects, one per line.
+    Queries are only counted when settings.DEBUG logs them; the query log
+    is cleared every time it's counted, so it can't grow for the whole run.
+    """
+    def __init__(self,label,total=None,interval=0,format='text',stage='insert'):
+        self.label=label
+        self.total=total
+        self.interval=interval
+        self.format=format
+        self.stage=stage
+        self.rows=0
+        self.dropped=0
+        self.queries=0
+        self.started=time.time()
+        self.reported=self.started
+
+    def add(self,rows,dropped=0,queries=None):
+        """
+        Records a batch, queries defaults to the ones logged in this process
+        """
+        self.rows+=rows
+        self.dropped+=dropped
+        if queries is None:
+            queries=len(connection.queries)
+            reset_queries()
+        self.queries+=queries
+        if self.interval and time.time()-self.reported>=self.interval:
+            self.report('progress')
+
+    def report(self,event='progress'):
+        self.reported=time.time()
+        elapsed=self.reported-self.started
+        rate=self.rows/max(elapsed,0.000001)
+        eta=None
+        if self.total and rate: eta=round(max(self.total-self.rows-self.dropped,0)/rate,1)
+        queries=None
+        if settings.DEBUG: queries=self.queries
+        if self.format=='json':
+            print simplejson.dumps({'event':event,'stage':self.stage,'label':self.label,'rows':self.rows,'total':self.total,'dropped':self.dropped,
+                'queries':queries,'elapsed':round(elapsed,3),'rows_per_sec':round(rate,1),'eta':eta})
+            return
+        if event=='done':
+            line="%s: %d rows in %.2fs (%.1f rows/sec), %d dropped" % (self.label,self.rows,elapsed,rate,self.dropped)
+        else:
+            line="%s: %d/%s rows, %.1f rows/sec, %.1fs elapsed" % (self.label,self.rows,self.total or '?',rate,elapsed)
+            if eta is not None: line+=", ETA %.1fs" % eta
+        if queries is not None: line+=", %d queries" % queries
+        print line
+        sys.stdout.flush()
+
+    def finish(self):
+        self.report('done')
+
+class GeneratorStats(object):
+    """
+    Calls, cumulative time and time percentiles of the value generators, per
+    (model,field,generator), for --stats. Only the closures of compiled plans
+    are wrapped, and only with --stats, so runs without it pay nothing.
+    The durations of every key are kept in a bounded reservoir, sampled with
+    a random stream of its own so the data generated doesn't change.
+    """
+    samples=1000
+
+    def __init__(self):
+        self.entries={}
+        self.random=random.Random(0)
+
+    def record(self,key,calls,seconds):
+        entry=self.entries.get(key,None)
+        if entry is None:
+            entry=self.entries[key]=[0,0.0,[],0]
+        entry[0]+=calls
+        entry[1]+=seconds
+        entry[3]+=1
+        if len(entry[2])<self.samples: entry[2].append(seconds/calls)
+        else:
+            i=self.random.randrange(0,entry[3])
+            if i<self.samples: entry[2][i]=seconds/calls
+
+    def wrap(self,model,field,generator,generate,column=None):
+        """
+        Returns generate and column closures timed under model, field and
+        generator names. Column calls are recorded as count calls.
+        """
+        label="%s.%s" % (model._meta.app_label,model._meta.object_name)
+        key=(label,field,generator)
+        timer=time.time
+        record=self.record
+        def timed_generate():
+            started=timer()
+            value=generate()
+            record(key,1,timer()-started)
+            return value
+        timed_column=None
+        if column:
+            column_key=(label,field,generator.replace('generate_','column_',1))
+            def timed_column(count):
+                started=timer()
+                values=column(count)
+                if count: record(column_key,count,timer()-started)
+                return values
+        return timed_generate,timed_column
+
+    def merge(self,entries):
+        """
+        Adds the entries collected by a worker process
+        """
+        for key,(calls,seconds,samples,seen) in entries.items():
+            entry=self.entries.get(key,None)
+            if entry is None:
+                self.entries[key]=[calls,seconds,list(samples),seen]
+                continue
+            entry[0]+=calls
+            entry[1]+=seconds
+            entry[3]+=seen
+            entry[2]=(entry[2]+list(samples))[:self.samples]
+
+    def rows(self):
+        """
+        Returns a dict per (model,field,generator), slowest first. Times are
+        in seconds, percentiles are per value.
+        """
+        rows=[]
+        for (model,field,generator),(calls,seconds,samples,seen) in self.entries.items():
+            samples=sorted(samples)
+            percentile=lambda p: samples[min(int(p*len(samples)),len(samples)-1)]
+            rows.append({'model':model,'field':field,'generator':generator,'calls':calls,'seconds':seconds,
+                'mean':seconds/max(calls,1),'p50':percentile(0.5),'p95':percentile(0.95),'p99':percentile(0.99)})
+        rows.sort(key=lambda row: -row['seconds'])
+        return rows
+
+    def report(self,format='text'):
+        rows=self.rows()
+        if format=='json':
+            for row in rows:
+                event=dict(row)
+                event['event']='stats'
+                print simplejson.dumps(event)
+            return
+        print "%-30s %-20s %-28s %10s %9s %9s %9s %9s %9s" % ('model','field','generator','calls','total s','mean us','p50 us','p95 us','p99 us')
+        for row in rows:
+            print "%-30s %-20s %-28s %10d %9.3f %9.1f %9.1f %9.1f %9.1f" % (row['model'],row['field'],row['generator'],row['calls'],row['seconds'],
+                row['mean']*1000000,row['p50']*1000000,row['p95']*1000000,row['p99']*1000000)
+
+class Exporter(object):
+    """
+    Streams generated rows to path, gzipped when it ends with .gz, for
+    --output. 'jsonl' writes an object per line and 'django-json' a fixture
+    for loaddata, both shaped like Django's serializers write them. 'csv'
+    writes a file per model, and per many to many field, named after them
+    next to path, each with a header line.
+    """
+    def __init__(self,path,format='jsonl'):
+        self.path=path
+        self.format=format
+        self.files=[]
+        self.writers={}
+        self.first=True
+        if format!='csv':
+            from django.core.serializers.json import DjangoJSONEncoder
+            self.encoder=DjangoJSONEncoder
+            self.output=self._open(path)
+            if format=='django-json': self.output.write('[\n')
+
+    def _open(self,path):
+        if path.endswith('.gz'): output=gzip.open(path,'wb')
+        else: output=open(path,'wb')
+        self.files.append(output)
+        return output
+
+    def _csv(self,name,header):
+        writer=self.writers.get(name,None)
+        if writer is None:
+            base,compressed=self.path,''
+            if base.endswith('.gz'): base,compressed=base[:-3],'.gz'
+            base,extension=os.path.splitext(base)
+            writer=csv.writer(self._open("%s.%s%s%s" % (base,name,extension or '.csv',compressed)))
+            writer.writerow(header)
+            self.writers[name]=writer
+        return writer
+
+    def _csv_value(self,value):
+        if value is None: return ''
+        if value is True: return '1'
+        if value is False: return '0'
+        if isinstance(value,unicode): return value.encode('utf-8')
+        return str(value)
+
+    def write(self,label,pk,fields,many_to_many):
+        """
+        Writes a row: label is app_label.modelname, fields are (name,value)
+        pairs in the model's order, many_to_many (name,related keys) pairs
+        """
+        if self.format=='csv':
+            self._csv(label,['pk']+[name for name,value in fields]).writerow([self._csv_value(pk)]+[self._csv_value(value) for name,value in fields])
+            for name,keys in many_to_many:
+                writer=self._csv("%s.%s" % (label,name),['pk','related_pk'])
+                for key in keys: writer.writerow([self._csv_value(pk),self._csv_value(key)])
+            return
+        record=simplejson.dumps({'model':label,'pk':pk,'fields':dict(fields+many_to_many)},cls=self.encoder)
+        if self.format=='jsonl':
+            self.output.write(record+'\n')
+            return
+        if not self.first: self.output.write(',\n')
+        self.first=False
+        self.output.write(record)
+
+    def close(self):
+        if self.format=='django-json': self.output.write('\n]\n')
+        for output in self.files: output.close()
+
+class Checkpoint(object):
+    """
+    Progress of a --target-rows run, rewritten after every committed batch so
+    an interrupted run can resume where it stopped: the rows created per
+    model, the ranges of integer keys they got, the stages done after the
+    inserts, the seed and the position of the next batch. Batches draw from
+    streams keyed by their position, so a resumed run picks up the streams
+    where the interrupted one stopped.
+    """
+    def __init__(self,path):
+        self.path=path
+        self.resumed=os.path.exists(path)
+        if self.resumed: self.state=simplejson.load(open(path))
+        else: self.state={'seed':None,'target':None,'models':{}}
+
+    def _model(self,model):
+        label="%s.%s" % (model._meta.app_label,model._meta.object_name)
+        return self.state['models'].setdefault(label,{'created':0,'position':0,'ranges':[],'stages':[]})
+
+    def created(self,model):
+        return self._model(model)['created']
+
+    def position(self,model):
+        """
+        Returns the row position following the last batch of model
+        """
+        return self._model(model)['position']
+
+    def keys(self,model):
+        """
+        Returns an array of the integer keys recorded for model
+        """
+        pks=key_array(model._meta.pk)
+        for first,last in self._model(model)['ranges']: pks.extend(xrange(first,last+1))
+        return pks
+
+    def batch(self,model,pks,position):
+        """
+        Records the keys of a committed batch of model, and the row position
+        following it, and saves the checkpoint
+        """
+        progress=self._model(model)
+        progress['created']+=len(pks)
+        progress['position']=max(progress['position'],position)
+        #more rows mean the later stages must run again
+        progress['stages']=[]
+        if model._meta.pk.get_internal_type() in INTEGER_KEY_TYPES:
+            ranges=progress['ranges']
+            for pk in sorted(pks):
+                if ranges and ranges[-1][1]+1==pk: ranges[-1][1]=pk
+                else: ranges.append([pk,pk])
+        self.save()
+
+    def done(self,model,stage):
+        return stage in self._model(model)['stages']
+
+    def stage(self,model,stage):
+        """
+        Records a stage done for model (deferred ForeignKeys, many to manys)
+        """
+        self._model(model)['stages'].append(stage)
+        self.save()
+
+    def save(self):
+        #write aside and rename, so an interruption never leaves half a checkpoint
+        output=open(self.path+'.tmp','w')
+        simplejson.dump(self.state,output)
+        output.close()
+        os.rename(self.path+'.tmp',self.path)
+
+    def remove(self):
+        if os.path.exists(self.path): os.remove(self.path)
+
+class ImageWriter(object):
+    """
+    Encodes and writes PNGs on a pool of background threads, so generating
+    and inserting rows doesn't wait on PIL
+    """
+    def __init__(self,threads):
+        self.queue=Queue.Queue(threads*4)
+        self.errors=[]
+        for i in range(threads):
+            thread=threading.Thread(target=self._run)
+            thread.setDaemon(True)
+            thread.start()
+
+    def _run(self):
+        while True:
+            im,path=self.queue.get()
+            try:
+                im.save(path,'PNG')
+            except IOError, e:
+                self.errors.append("%s: %s" % (path,e))
+            self.queue.task_done()
+
+    def save(self,im,path):
+        """
+        Queues an image, blocks while the queue is full
+        """
+        self.queue.put((im,path))
+
+    def join(self):
+        """
+        Waits until every queued image is written
+        """
+        self.queue.join()
 
 class Command(BaseCommand):
     """
@@ -101,9 +744,52 @@ class Command(BaseCommand):
     5. Addition to #4, generate data for multiple models
        >>python manage.py dilla -a app_name -m ModelName -m AnotherModelName
     
-    ** The order of app names and model names are important, if a model has
-       a ForeignKey to another model, but there isn't data available yet
-       in the foregn table, problems occur.
+    6. Write rows with multi-row INSERTs, 1000 rows per transaction
+       >>python manage.py dilla -i 100000 -b 1000 app_name
+    
+    7. Sample ForeignKeys from a reservoir of at most 100000 keys per related model
+       >>python manage.py dilla --fk-pool-size 100000 app_name
+    
+    8. Spread the rows of each model over 8 processes, reproducibly
+       >>python manage.py dilla -i 1000000 -b 1000 -w 8 --seed 42 app_name
+    
+    9. Load rows with the database's native bulk loader (LOAD DATA / COPY)
+       >>python manage.py dilla -i 10000000 -b 10000 --loader app_name
+    
+    10. Render 20 images per resolution, reuse them, and write PNGs on 4 threads
+       >>python manage.py dilla --image-pool 20 --image-threads 4 app_name
+    
+    11. Skip the confirmation and report progress every 10 seconds as JSON lines
+       >>python manage.py dilla --noinput --progress 10 --metrics json app_name
+    
+    12. Top every model up to 50000000 rows, run it again to resume after an interruption
+       >>python manage.py dilla --target-rows 50000000 -b 10000 --checkpoint seed.json app_name
+    
+    13. Generate rows while 2 threads write the previous batches, at most 8 batches ahead
+       >>python manage.py dilla -i 1000000 -b 1000 --writers 2 --queue-depth 8 app_name
+    
+    14. Estimate the size of a dataset 1000 times the DillaController ratios, then create it
+       >>python manage.py dilla --scale 1000 --estimate app_name
+       >>python manage.py dilla --scale 1000 app_name
+    
+    15. Print the calls, time and percentiles of every field's generator at the end
+       >>python manage.py dilla --stats app_name
+       settings.DILLA_STATS_HOOKS=('myproject.monitoring.export_dilla_stats',) #also called with the rows of the table
+    
+    16. Save the dataset to a snapshot the first time, load the snapshot while the models don't change
+       >>python manage.py dilla --noinput --seed 42 --snapshot /var/cache/dilla app_name
+    
+    17. Write 1000000 rows per model to a gzipped fixture instead of the database
+       >>python manage.py dilla -i 1000000 --output dataset.json.gz --format django-json app_name
+    
+    18. Regenerate the title and price of 5% of the existing rows, for a write heavy load test
+       >>python manage.py dilla --noinput --mutate 0.05 --fields title --fields Product.price -b 1000 app_name
+    
+    ** Models are populated after the models their ForeignKeys point to,
+       models that don't depend on each other are populated concurrently
+       when using --workers. Nullable ForeignKeys to the model itself, or
+       closing a cycle, are filled with bulk UPDATEs once every model is
+       populated.
     
     ** When using -a or -m, you don't need to use full python path.
     """
@@ -116,15 +802,58 @@ class Command(BaseCommand):
         make_option('--no-doubt','-n',action='store_true',dest='no_doubt',help='Always fill fields that can be blank. Do not randomly decide.'),
         make_option('--app','-a',action='append',dest='apps',help='Generate data for these apps.'),
         make_option('--model','-m',action='append',dest='models',help='Generate data for these models.'),
+        make_option('--batch-size','-b',default='0',action='store',dest='batch_size',help='Write rows with multi-row INSERTs (MySQL, PostgreSQL and SQLite, executemany() on other backends), N rows per transaction. Default is 0 (one save() per row).'),
+        make_option('--fk-pool-size',default='0',action='store',dest='fk_pool_size',help='Keep at most N sampled keys per related model for ForeignKeys. Default is 0 (load every key).'),
+        make_option('--workers','-w',default='1',action='store',dest='workers',help='Shard the iterations of each model across N processes, each with its own database connection. Default is 1.'),
+        make_option('--seed',action='store',dest='seed',help='Master seed of the random streams. Every batch of rows draws from a stream derived from the seed and its position, so a run, or any worker shard, is regenerated identically. A random one is picked and printed if not given.'),
+        make_option('--image-pool',default='0',action='store',dest='image_pool',help='Render at most N images per resolution and hard link (or copy) them for the other rows. Default is 0 (render every image).'),
+        make_option('--image-threads',default='0',action='store',dest='image_threads',help='Encode and write PNGs on N background threads. Default is 0 (write them inline).'),
+        make_option('--noinput',action='store_false',dest='interactive',default=True,help='Do not ask for confirmation before adding data to the database.'),
+        make_option('--progress',default='5',action='store',dest='progress',help='Report progress every N seconds, 0 only reports totals. Default is 5.'),
+        make_option('--metrics',default='text',action='store',dest='metrics',choices=('text','json'),help='Report progress and totals as text lines or as JSON objects, one per line. Default is text.'),
+        make_option('--loader','-l',action='store_true',dest='loader',help='Stream rows to a temporary file and load it with LOAD DATA LOCAL INFILE (MySQL, needs local_infile in DATABASE_OPTIONS) or COPY FROM STDIN (PostgreSQL). Other backends use multi-row INSERTs.'),
+        make_option('--target-rows',action='store',dest='target_rows',help='Create only the rows missing for every model to have N rows, instead of --iter more. Progress is checkpointed, so an interrupted run resumes when run again.'),
+        make_option('--writers',default='0',action='store',dest='writers',help='Write batches on N threads, each with its own database connection, while the next ones are generated. Not used with --loader. Default is 0 (generate and write in turn).'),
+        make_option('--queue-depth',default='4',action='store',dest='queue_depth',help='With --writers, generate at most N batches ahead of the writers. Default is 4.'),
+        make_option('--scale',action='store',dest='scale',help='Create N times the rows of the DillaController ratios of every model, instead of --iter (or --target-rows) rows. Prints an estimate of the run first.'),
+        make_option('--estimate',action='store_true',dest='estimate',help='Only print the rows, bytes and generation time the run would take, measured on sample rows.'),
+        make_option('--stats',action='store_true',dest='stats',help='Time every field generator, and print calls, total time and percentiles per model, field and generator at the end. The numbers are also passed to the callables named in settings.DILLA_STATS_HOOKS.'),
+        make_option('--snapshot',action='store',dest='snapshot',help='Snapshot directory. Runs load the snapshot of the same models, seed and row counts if there is one, and save one otherwise. The seed defaults to 0. Image files are not part of snapshots.'),
+        make_option('--output','-o',action='store',dest='output',help='Stream the rows to this file instead of the database, gzipped if it ends with .gz. Keys are numbered from 1 in the run, ForeignKeys and many to manys point to rows of the same file.'),
+        make_option('--format',default='jsonl',action='store',dest='format',choices=('jsonl','csv','django-json'),help='--output format: jsonl (an object per line), csv (a file per model and many to many field) or django-json (a loaddata fixture). Default is jsonl.'),
+        make_option('--mutate',action='store',dest='mutate',help='Instead of adding rows, regenerate the --fields of this fraction (0 to 1) of the existing rows of every model, with bulk UPDATEs. Each row is picked with that probability, walking the keys a --batch-size at a time.'),
+        make_option('--fields',action='append',dest='fields',help='Fields regenerated by --mutate, as name (any model having it) or Model.name.'),
+        make_option('--checkpoint',default='dilla-checkpoint.json',action='store',dest='checkpoint',help='Checkpoint file of --target-rows runs, removed once a run completes. Default is dilla-checkpoint.json.'),
     )
     
+    def __init__(self):
+        super(Command,self).__init__()
+        self.pk_pools={}
+        self.fk_pool_size=0
+        self.corpus=None
+        self.row_offset=0
+        self.deferred={}
+        self.distributions={}
+        self.exporting=False
+        #(index,count) of the worker shard this command populates
+        self.shard=None
+        self.rng=DillaRandom()
+        self.stats=None
+        self.checkpoint=None
+        #keys written so far by populate(), still there when it fails halfway
+        self.created=None
+        #guards the pools, metrics and checkpoint shared with the writer threads
+        self.lock=threading.Lock()
+        self.image_pools={}
+        self.image_pool_size=0
+        self.image_threads=0
+        self.image_writer=None
+    
     def handle(self,*app_labels,**options):
         """
         Main execution point
         """
-        if not settings.DEBUG:
-            confirm=raw_input(confirm_message)
-            if confirm != 'yes': return
+        load_numpy()
         models=[]
         model_labels=[]
         apps=[]
@@ -148,35 +877,934 @@ class Command(BaseCommand):
                         else: print "Model " + model + " not found."
             else:
                 models.extend(get_models(app))
-        instances_by_model={}
+        batch_size=int(options.get('batch_size') or 0)
+        workers=int(options.get('workers') or 1)
+        target_rows=options.get('target_rows',None)
+        if target_rows is not None:
+            self.checkpoint=Checkpoint(options.get('checkpoint') or 'dilla-checkpoint.json')
+            if self.checkpoint.resumed: print "Resuming from %s" % self.checkpoint.path
+        seed=options.get('seed',None)
+        if seed is None and self.checkpoint and self.checkpoint.state['seed'] is not None: seed=self.checkpoint.state['seed']
+        #a snapshot is only found again with the same seed
+        if seed is None and options.get('snapshot',None): seed=0
+        if seed is None:
+            seed=random.randint(0,sys.maxint)
+            print "Seed: %d" % seed
+        seed=int(seed)
+        self._seed(seed)
+        if self.checkpoint:
+            self.checkpoint.state['seed']=seed
+            self.checkpoint.state['target']=int(target_rows)
+        self.fk_pool_size=int(options.get('fk_pool_size') or 0)
+        self.pk_pools={}
+        #only the compact primary key arrays of created rows are kept for the later stages
+        pks_by_model={}
+        populated=[]
+        counts={}
         for model in models:
-            dilla=None
-            if not instances_by_model.get(model,None):instances_by_model[model]=[]
-            if hasattr(model,'Dilla'):dilla=model.Dilla
+            if model in pks_by_model: continue
+            pks_by_model[model]=key_array(model._meta.pk)
+            dilla=getattr(model,'Dilla',None)
             if dilla and getattr(dilla,'skip_model',False):continue
-            for i in range(int(options['iterations'])):
-                instance=model()
-                for field in model._meta.fields:
-                    if not field.auto_created:
-                        if not field.blank or options['no_doubt'] or hasattr(field,"auto_now") or hasattr(field,"auto_now_add"):
-                            self.fill(field=field,obj=instance,dilla=dilla)
-                        elif field.blank:
-                            self._decide(self.fill,field=field,obj=instance,dilla=dilla)
-                
-                try:
-                    instance.save()
-                    #if field has unique, this error will be thrown, in the case of dilla, we don't care
-                except MySQLdb.IntegrityError:
-                    instance=None
-                    continue
-                instances_by_model[model].append(instance)
-            print "SQL Debug :\n-----------------"
-            print connection.queries
-        for model in models: #go back through each model, and alter each instance's many to many fields
+            populated.append(model)
+            counts[model]=self._row_count(model,options)
+            if self.checkpoint:
+                #rows created by an interrupted run still need their deferred ForeignKeys and many to manys
+                pks_by_model[model].extend(self.checkpoint.keys(model))
+                counts[model]=max(counts[model]-model._default_manager.count(),0)
+        self.exporting=bool(options.get('output',None))
+        levels,self.deferred=self._dependency_levels(populated,self.exporting)
+        if options.get('scale',None) or options.get('estimate',False):
+            self._estimate(populated,counts,options)
+            if options.get('estimate',False): return
+        if self.exporting:
+            #nothing is written to the database, there's nothing to confirm
+            self._export(levels,counts,options)
+            return
+        if not settings.DEBUG and options.get('interactive',True):
+            confirm=raw_input(confirm_message % (settings.DATABASE_USER,settings.DATABASE_NAME))
+            if confirm != 'yes': return
+        if options.get('mutate',None) is not None:
+            fraction=float(options['mutate'])
+            if not 0<fraction<=1:
+                print "--mutate takes a fraction of the rows, between 0 and 1"
+                return
+            if not options.get('fields',None):
+                print "--mutate needs the --fields to regenerate"
+                return
+            for level in levels:
+                for model in level: self._mutate(model,fraction,options['fields'],options)
+            return
+        snapshot=None
+        if options.get('snapshot',None):
+            ordered=[model for level in levels for model in level]
+            snapshot=os.path.join(options['snapshot'],"%s.dilla.gz" % self._snapshot_key(ordered,counts,seed,options))
+            if os.path.exists(snapshot):
+                print "Loading snapshot %s" % snapshot
+                self._load_snapshot(snapshot,ordered,options)
+                return
+        if options.get('stats',False): self.stats=GeneratorStats()
+        process_pool=None
+        if workers>1:
+            from multiprocessing import Pool
+            #workers must not share the parent's connection, they open their own
+            connection.close()
+            process_pool=Pool(workers)
+        for level in levels:
+            if process_pool:
+                #every model of a level is sharded at once, so independent models are populated concurrently
+                metrics=dict([(model,self._metrics(model._meta.object_name,counts[model],options)) for model in level])
+                results=self._populate_parallel(process_pool,level,counts,options,seed,workers,metrics)
+            for model in level:
+                errors=[]
+                if process_pool:
+                    pks,errors=results[model]
+                else:
+                    metrics={model:self._metrics(model._meta.object_name,counts[model],options)}
+                    row_offset=0
+                    if self.checkpoint: row_offset=self.checkpoint.position(model)
+                    pks=self.populate(model,counts[model],options,metrics=metrics[model],row_offset=row_offset)
+                if options.get('loader',False): self._reset_sequences(model)
+                pks_by_model[model].extend(pks)
+                metrics[model].finish()
+                for error in errors: print "Worker failed for %s: %s" % (model._meta.object_name,error)
+        if process_pool:
+            process_pool.close()
+            process_pool.join()
+        for model in populated:
+            if model not in self.deferred: continue
+            if self.checkpoint and self.checkpoint.done(model,'deferred'): continue
+            self._fill_deferred(model,self.deferred[model],pks_by_model[model],options)
+            if self.checkpoint: self.checkpoint.stage(model,'deferred')
+        for model in pks_by_model.keys(): #go back through each model, and fill the many to many fields of the rows created
             if len(model._meta.many_to_many) <= 0: continue
-            instances_list=instances_by_model[model]
+            if self.checkpoint and self.checkpoint.done(model,'m2m'): continue
             dilla=getattr(model,'Dilla',False)
-            self.many_to_manys(model,instances_list,dilla)
+            self.many_to_manys(model,pks_by_model[model],dilla,batch_size or 1000,options)
+            if self.checkpoint: self.checkpoint.stage(model,'m2m')
+        if self.checkpoint: self.checkpoint.remove()
+        if snapshot:
+            self._save_snapshot(snapshot,ordered,pks_by_model)
+            print "Snapshot saved to %s" % snapshot
+        if self.stats:
+            self.stats.report(options.get('metrics','text'))
+            self._stats_hooks(self.stats.rows())
+
+    def _snapshot_key(self,models,counts,seed,options):
+        """
+        sha1 of everything that decides the data of a run: the database
+        backend, seed, row counts, fields of the models and their Dilla
+        settings (custom generators by name)
+        """
+        def stable(value):
+            if isinstance(value,dict): return [(key,stable(value[key])) for key in sorted(value.keys())]
+            if isinstance(value,(list,tuple)): return [stable(item) for item in value]
+            if callable(value): return getattr(value,'__name__','callable')
+            return value
+        key=[settings.DATABASE_ENGINE,seed,bool(options.get('no_doubt',False))]
+        for model in models:
+            meta=model._meta
+            fields=[(f.name,f.column,f.get_internal_type(),f.null,f.blank,f.unique,f.max_length,f.rel and f.rel.to._meta.db_table) for f in meta.fields]
+            many_to_many=[(f.name,f.m2m_db_table(),self._fan_out(model,f,getattr(model,'Dilla',None))) for f in meta.many_to_many]
+            dilla=getattr(model,'Dilla',None)
+            dilla_settings=dilla and [(name,stable(getattr(dilla,name))) for name in sorted(dir(dilla)) if not name.startswith('_')]
+            key.append((meta.app_label,meta.object_name,meta.db_table,counts[model],fields,many_to_many,dilla_settings))
+        return hashlib.sha1(repr(key)).hexdigest()
+
+    def _snapshot_tables(self,model):
+        """
+        Returns the (table,columns,fields,key column) of every table holding
+        rows of model: its parents' tables, its own, and its many to many
+        tables. fields are None for the key columns of many to many tables.
+        """
+        meta=model._meta
+        tables=[]
+        #get_parent_list() is a set, walk the parents root first instead
+        parents=[]
+        def add_parents(child):
+            for parent in child._meta.parents.keys():
+                add_parents(parent)
+                if parent not in parents: parents.append(parent)
+        add_parents(model)
+        for parent in parents:
+            tables.append((parent._meta.db_table,[f.column for f in parent._meta.local_fields],parent._meta.local_fields,parent._meta.pk.column))
+        tables.append((meta.db_table,[f.column for f in meta.local_fields],meta.local_fields,meta.pk.column))
+        for f in meta.many_to_many:
+            if has_intermediary(f): continue
+            tables.append((f.m2m_db_table(),[f.m2m_column_name(),f.m2m_reverse_name()],[None,None],f.m2m_column_name()))
+        return tables
+
+    def _save_snapshot(self,path,models,pks_by_model,chunk_size=SQLITE_MAX_VARIABLES):
+        """
+        Reads the rows created by this run back from the database, once their
+        deferred ForeignKeys and many to manys are filled, and writes them to
+        path as a gzipped stream of pickled (table,columns,rows) chunks
+        """
+        qn=connection.ops.quote_name
+        directory=os.path.dirname(path)
+        if directory and not os.path.exists(directory): os.makedirs(directory)
+        output=gzip.open(path+'.tmp','wb')
+        try:
+            pickle.dump({'version':1},output,2)
+            cursor=connection.cursor()
+            for model in models:
+                pks=pks_by_model[model]
+                for table,columns,fields,key_column in self._snapshot_tables(model):
+                    for start in xrange(0,len(pks),chunk_size):
+                        chunk=list(pks[start:start+chunk_size])
+                        cursor.execute("SELECT %s FROM %s WHERE %s IN (%s)" % (",".join([qn(c) for c in columns]),qn(table),qn(key_column),",".join(["%s"]*len(chunk))),chunk)
+                        rows=cursor.fetchall()
+                        if rows: pickle.dump((table,columns,rows),output,2)
+            pickle.dump(None,output,2)
+            output.close()
+        except:
+            #a partial snapshot must not be found by the next run
+            output.close()
+            os.remove(path+'.tmp')
+            raise
+        os.rename(path+'.tmp',path)
+
+    def _load_snapshot(self,path,models,options):
+        """
+        Replays a snapshot with multi-row INSERTs, keys included, and moves
+        the key sequences past them. Values are read back as Python objects,
+        they're prepared for the database by their fields again. On MySQL,
+        foreign key checks are off while loading, deferred ForeignKeys can
+        point to later tables.
+        """
+        def prepare(field,value):
+            if field is None: return value
+            return field.get_db_prep_save(value)
+        fields_by_table={}
+        for model in models:
+            for table,columns,fields,key_column in self._snapshot_tables(model): fields_by_table[table]=fields
+        mysql=settings.DATABASE_ENGINE.startswith('mysql')
+        cursor=connection.cursor()
+        if mysql: cursor.execute("SET FOREIGN_KEY_CHECKS=0")
+        input=gzip.open(path,'rb')
+        pickle.load(input)
+        metrics={}
+        try:
+            while True:
+                chunk=pickle.load(input)
+                if chunk is None: break
+                table,columns,rows=chunk
+                if table not in metrics: metrics[table]=self._metrics(table,None,options,'snapshot')
+                fields=fields_by_table[table]
+                if [f for f in fields if f]: rows=[[prepare(f,value) for f,value in zip(fields,row)] for row in rows]
+                written=len(self._insert_rows(table,columns,rows))
+                metrics[table].add(written,len(rows)-written)
+        finally:
+            input.close()
+            if mysql: connection.cursor().execute("SET FOREIGN_KEY_CHECKS=1")
+        for table in metrics.keys(): metrics[table].finish()
+        for model in models:
+            for parent in model._meta.get_parent_list(): self._reset_sequences(parent)
+            self._reset_sequences(model)
+
+    def _stats_hooks(self,rows):
+        """
+        Passes the --stats rows to every callable named by a dotted path in
+        settings.DILLA_STATS_HOOKS, to export them somewhere else
+        """
+        for path in getattr(settings,'DILLA_STATS_HOOKS',()):
+            try:
+                module,name=path.rsplit('.',1)
+                getattr(import_module(module),name)(rows)
+            except Exception, e:
+                print "Stats hook %s failed: %s: %s" % (path,e.__class__.__name__,e)
+
+    def _export(self,levels,counts,options):
+        """
+        Streams the generated rows of every model to the --output file, batch
+        by batch, without model instances nor database writes. AutoField keys
+        are numbered from 1, and the run's key pools only hold the keys
+        written, so ForeignKeys and many to manys (sampled inline) point to
+        rows of the same output. Deferred ForeignKeys are left empty.
+        """
+        exporter=Exporter(options['output'],options.get('format') or 'jsonl')
+        chunk_size=int(options.get('batch_size') or 0) or 1000
+        self.image_pool_size=int(options.get('image_pool') or 0)
+        ordered=[model for level in levels for model in level]
+        #rows only reach the pools that exist when they're written, create every pool the export samples first
+        for model in ordered:
+            self._pk_pool(model)
+            for f in model._meta.fields:
+                if isinstance(f,ForeignKey): self._pk_pool(f.rel.to,f.rel.field_name)
+            for f in model._meta.many_to_many: self._pk_pool(f.rel.to)
+        try:
+            for model in ordered:
+                meta=model._meta
+                if meta.parents:
+                    print "%s inherits from another model, it can't be exported" % meta.object_name
+                    continue
+                label="%s.%s" % (meta.app_label,meta.object_name)
+                self.row_offset=0
+                self._stream(label,'plan',0)
+                dilla=getattr(model,'Dilla',None)
+                plan=self._compile_plan(model,dilla,options.get('no_doubt',False),exclude=self.deferred.get(model,()))
+                together=self._unique_together(model)
+                auto_pk=isinstance(meta.pk,AutoField)
+                next_pk=1
+                fields=[f for f in meta.fields if f is not meta.pk]
+                many_to_manys=[(f,self._fan_out(model,f,dilla)) for f in meta.many_to_many if not has_intermediary(f)]
+                metrics=self._metrics(meta.object_name,counts[model],options,'export')
+                count=counts[model]
+                for start in xrange(0,count,chunk_size):
+                    size=min(chunk_size,count-start)
+                    self._stream(label,'rows',start)
+                    rows=self._build_instances(model,plan,size,together,self._fill_rows)
+                    for row in rows:
+                        if auto_pk:
+                            row[meta.pk.attname]=next_pk
+                            next_pk+=1
+                        related=[]
+                        for f,(low,high) in many_to_manys:
+                            pool=self._pk_pool(f.rel.to)
+                            end=self.rng.randint(low,high)
+                            if len(pool)<=end: keys=set(pool.pks)
+                            else:
+                                keys=set()
+                                while len(keys)<end: keys.add(pool.sample())
+                            related.append((f.name,sorted(keys)))
+                        #the database coerces values to their field types on insert (dates from datetimes), fixtures need it done here
+                        exporter.write(label.lower(),row[meta.pk.attname],[(f.name,f.to_python(row[f.attname])) for f in fields],related)
+                    for key,pool in self.pk_pools.items():
+                        if key[0] is model: pool.extend([row[meta.get_field(key[1]).attname] for row in rows])
+                    metrics.add(len(rows),size-len(rows))
+                metrics.finish()
+        finally:
+            exporter.close()
+            self._finish_images()
+
+    def _controller(self,model):
+        """
+        Returns the DillaController of model's app, or None
+        """
+        return getattr(get_app(model._meta.app_label),'DillaController',None)
+
+    def _row_count(self,model,options):
+        """
+        Rows to create for model: --iter, or the model's DillaController
+        ratio times --scale. In --target-rows mode, the rows model should have.
+        """
+        scale=options.get('scale',None)
+        ratios=getattr(self._controller(model),'ratios',None) or {}
+        if scale and model._meta.object_name in ratios:
+            return int(round(float(scale)*ratios[model._meta.object_name]))
+        if options.get('target_rows',None) is not None: return int(options['target_rows'])
+        return int(options['iterations'])
+
+    def _fan_out(self,model,many_to_many_field,dilla=None):
+        """
+        Returns the (min,max) related rows to create per row of a many to many
+        field: the DillaController fan_out, or else 0 to the 'max' field extra
+        (exclusive, 5 by default)
+        """
+        fan_out=getattr(self._controller(model),'fan_out',None) or {}
+        fan_out=fan_out.get("%s.%s" % (model._meta.object_name,many_to_many_field.name),None)
+        if fan_out is not None:
+            if isinstance(fan_out,(int,long)): return fan_out,fan_out
+            return fan_out[0],fan_out[1]
+        max_count=5
+        if dilla and hasattr(dilla,"field_extras"):
+            field_extras=dilla.field_extras.get(many_to_many_field.name,None)
+            if field_extras: max_count=field_extras.get("max",5)
+        return 0,max(max_count-1,0)
+
+    def _estimate(self,models,counts,options,sample=200):
+        """
+        Prints the rows, bytes and generation time a run would take. Every
+        model generates sample rows (without saving them, nor images) to
+        measure its generator throughput and the size of its values.
+        Bytes only count the values, not the indexes nor the row overhead,
+        and time only counts generation, writing comes on top.
+        Samples draw from streams of their own, the run's data doesn't change.
+        """
+        total_rows=0
+        total_bytes=0
+        total_seconds=0.0
+        for model in models:
+            dilla=getattr(model,'Dilla',None)
+            image_fields=getattr(dilla,'image_fields',None) or ()
+            fields=dict([(f.attname,f) for f in model._meta.fields])
+            #key pools aren't populated yet and images would be written, their values are only sized
+            skipped=[f.attname for f in model._meta.fields if isinstance(f,ForeignKey) or f.name in image_fields]
+            plan=self._compile_plan(model,dilla,options.get('no_doubt',False),exclude=skipped)
+            size=min(counts[model],sample) or 1
+            self._stream(model._meta.app_label,model._meta.object_name,'estimate')
+            started=time.time()
+            instances=self._fill_instances(model,plan,size)
+            seconds=(time.time()-started)*counts[model]/size
+            row_bytes=8*len([name for name in skipped if isinstance(fields[name],ForeignKey)])+100*len([name for name in skipped if not isinstance(fields[name],ForeignKey)])
+            for instance in instances:
+                for name,generate,column,decide in plan:
+                    value=getattr(instance,name,None)
+                    if value is None: continue
+                    if isinstance(value,(int,long,bool,float,Decimal)): row_bytes+=8
+                    elif isinstance(value,unicode): row_bytes+=len(value.encode('utf-8'))
+                    else: row_bytes+=len(str(value))
+            row_bytes=float(row_bytes)/size
+            rows=counts[model]
+            model_bytes=int(row_bytes*rows)
+            through_rows=0
+            for many_to_many_field in model._meta.many_to_many:
+                if has_intermediary(many_to_many_field): continue
+                low,high=self._fan_out(model,many_to_many_field,dilla)
+                through_rows+=int(rows*(low+high)/2.0)
+            model_bytes+=16*through_rows
+            self._report_estimate(model._meta.object_name,rows,through_rows,model_bytes,seconds,options)
+            total_rows+=rows+through_rows
+            total_bytes+=model_bytes
+            total_seconds+=seconds
+        self._report_estimate('Total',total_rows,None,total_bytes,total_seconds,options)
+
+    def _report_estimate(self,label,rows,through_rows,bytes,seconds,options):
+        if options.get('metrics','text')=='json':
+            print simplejson.dumps({'event':'estimate','label':label,'rows':rows,'through_rows':through_rows,'bytes':bytes,'seconds':round(seconds,1)})
+            return
+        line="%s: %d rows" % (label,rows)
+        if through_rows: line+=" and %d many to many rows" % through_rows
+        print line+", about %.1f MB of values, %.1fs to generate" % (bytes/1048576.0,seconds)
+
+    def _dependency_levels(self,models,many_to_many=False):
+        """
+        Orders models so each one comes after the models its ForeignKeys
+        point to, grouped in levels of models that don't depend on each other.
+        Nullable ForeignKeys to the model itself, and the ones needed to break
+        a cycle, are deferred: left empty on insert and filled afterwards by
+        _fill_deferred(). Returns (levels,{model:[deferred attnames]}).
+        With many_to_many, models also come after the models of their many to
+        manys when possible, those are dropped first to break a cycle.
+        """
+        remaining=list(models)
+        deferred={}
+        edges={}
+        for model in remaining:
+            edges[model]=[]
+            fields=list(model._meta.fields)
+            if many_to_many: fields.extend([f for f in model._meta.many_to_many if f.rel.to is not model])
+            for field in fields:
+                if not isinstance(field,(ForeignKey,ManyToManyField)) or field.rel.to not in remaining: continue
+                if field.rel.to is model:
+                    if field.null: deferred.setdefault(model,[]).append(field.attname)
+                    continue
+                edges[model].append(field)
+        levels=[]
+        while remaining:
+            level=[model for model in remaining if not [f for f in edges[model] if f.rel.to in remaining]]
+            if not level:
+                #a cycle, drop the many to manys of the first model that has some, else defer its nullable ForeignKeys
+                for model in remaining:
+                    nullable=[f for f in edges[model] if isinstance(f,ManyToManyField) and f.rel.to in remaining]
+                    if not nullable: nullable=[f for f in edges[model] if f.null and f.rel.to in remaining]
+                    if not nullable: continue
+                    keys=[f.attname for f in nullable if not isinstance(f,ManyToManyField)]
+                    if keys: deferred.setdefault(model,[]).extend(keys)
+                    edges[model]=[f for f in edges[model] if f not in nullable]
+                    break
+                else:
+                    print "ForeignKey cycle without nullable fields between %s, populating %s first" % (", ".join([m._meta.object_name for m in remaining]),remaining[0]._meta.object_name)
+                    edges[remaining[0]]=[]
+                continue
+            levels.append(level)
+            remaining=[model for model in remaining if model not in level]
+        return levels,deferred
+
+    def _fill_deferred(self,model,attnames,pks,options):
+        """
+        Fills the ForeignKeys deferred by _dependency_levels() on the rows of
+        model created in this run, with batched bulk UPDATEs, now that the
+        models they point to are populated
+        """
+        batch_size=int(options.get('batch_size') or 0) or 1000
+        batches=((start,pks[start:start+batch_size]) for start in xrange(0,len(pks),batch_size))
+        return self._regenerate(model,attnames,batches,len(pks),options,'deferred',"%s deferred ForeignKeys" % model._meta.object_name,True)
+
+    def _mutate(self,model,fraction,names,options):
+        """
+        Regenerates the fields names (name or Model.name) of a random
+        fraction of the existing rows of model, for --mutate. Rather than with
+        order_by('?'), the table's keys are walked in order a batch at a time
+        (pk > last batch's), each key picked with probability fraction, so
+        memory doesn't grow with the table. Values come from the plan of
+        those fields, so Dilla field_extras apply as when creating rows.
+        """
+        meta=model._meta
+        local=dict([(f.name,f) for f in meta.local_fields if f is not meta.pk])
+        attnames=[]
+        for name in names:
+            if '.' in name:
+                object_name,name=name.split('.',1)
+                if object_name!=meta.object_name: continue
+            if name in local: attnames.append(local[name].attname)
+        if not attnames: return 0
+        label="%s.%s" % (meta.app_label,meta.object_name)
+        batch_size=int(options.get('batch_size') or 0) or 1000
+        manager=model._default_manager
+        pk_name=meta.pk.name
+        def batches():
+            position=0
+            last=None
+            while True:
+                keys=manager.order_by(pk_name)
+                if last is not None: keys=keys.filter(**{'%s__gt' % pk_name:last})
+                keys=list(keys.values_list(pk_name,flat=True)[:batch_size])
+                if not keys: return
+                self._stream(label,'mutate targets',position)
+                yield position,[key for key in keys if self.rng.random()<fraction]
+                position+=len(keys)
+                last=keys[-1]
+        total=int(round(manager.count()*fraction))
+        return self._regenerate(model,attnames,batches(),total,options,'mutate',"%s mutated" % meta.object_name)
+
+    def _regenerate(self,model,attnames,batches,total,options,stage,label,blank=False):
+        """
+        Sets new values of the fields attnames on the rows of model listed by
+        batches, (position,keys) tuples, with bulk UPDATEs, each batch drawing
+        from a stream keyed by stage and its position. Reports rows/sec as
+        label, out of total, returns the rows updated.
+        With blank, blank fields are left empty half of the time as on insert,
+        otherwise they always get a value (blank fields aren't always null).
+        """
+        plan=self._compile_plan(model,getattr(model,'Dilla',None),options.get('no_doubt',False),only=attnames)
+        if not plan: return 0
+        fields=dict([(f.attname,f) for f in model._meta.fields])
+        update_fields=[fields[name] for name,generate,column,decide in plan]
+        metrics=self._metrics(label,total,options,'update')
+        stream="%s.%s" % (model._meta.app_label,model._meta.object_name)
+        updated=0
+        for start,pks in batches:
+            self._stream(stream,stage,start)
+            rows=[]
+            for pk in pks:
+                row=[pk]
+                for name,generate,column,decide in plan:
+                    value=None
+                    if not (blank and decide) or self.rng.randint(0,1): value=generate()
+                    row.append(fields[name].get_db_prep_save(value))
+                rows.append(row)
+            count=self._bulk_update(model,update_fields,rows)
+            updated+=count
+            metrics.add(count,len(rows)-count)
+        metrics.finish()
+        return updated
+
+    def _bulk_update(self,model,fields,rows,batch_size=500):
+        """
+        Sets fields of existing rows with UPDATE ... SET column=CASE pk WHEN
+        ... END statements, batch_size rows per statement and transaction
+        (fewer on SQLite, which caps the parameters of a statement).
+        rows are (pk,value,...) tuples of database values, in fields order.
+        Returns the number of rows updated.
+        """
+        qn=connection.ops.quote_name
+        pk_column=qn(model._meta.pk.column)
+        #PostgreSQL types CASE branches of bare parameters (dates come as strings, or NULLs) as text
+        postgresql=settings.DATABASE_ENGINE.startswith('postgresql')
+        if settings.DATABASE_ENGINE=='sqlite3': batch_size=min(batch_size,max(SQLITE_MAX_VARIABLES/(2*len(fields)+1),1))
+        updated=0
+        for start in xrange(0,len(rows),batch_size):
+            batch=rows[start:start+batch_size]
+            assignments=[]
+            params=[]
+            for i,field in enumerate(fields):
+                value="%s"
+                if postgresql: value="CAST(%%s AS %s)" % field.db_type()
+                assignments.append("%s=CASE %s %s END" % (qn(field.column),pk_column," ".join(["WHEN %%s THEN %s" % value]*len(batch))))
+                for row in batch: params.extend((row[0],row[i+1]))
+            params.extend([row[0] for row in batch])
+            cursor=connection.cursor()
+            cursor.execute("UPDATE %s SET %s WHERE %s IN (%s)" % (qn(model._meta.db_table),",".join(assignments),pk_column,",".join(["%s"]*len(batch))),params)
+            updated+=cursor.rowcount
+            transaction.commit_unless_managed()
+        return updated
+
+    def _metrics(self,label,total,options,stage='insert'):
+        """
+        Returns a Metrics reporting the way the command options ask for
+        """
+        return Metrics(label,total,float(options.get('progress') or 0),options.get('metrics','text'),stage)
+
+    def populate(self,model,count,options,first_pk=None,metrics=None,row_offset=0):
+        """
+        Creates count rows of model in this process and returns an array of
+        the primary keys written. Rows, dropped rows and queries are recorded
+        on metrics after every batch. first_pk is the first AutoField value
+        to use in --loader mode, row_offset the position of these rows among
+        all the rows created for model in this run (for worker shards and
+        resumed runs). Every batch draws from the stream of its position.
+        """
+        if metrics is None: metrics=Metrics(model._meta.object_name,count)
+        self.row_offset=row_offset
+        label="%s.%s" % (model._meta.app_label,model._meta.object_name)
+        self._stream(label,'plan',row_offset)
+        batch_size=int(options.get('batch_size') or 0)
+        self.image_pool_size=int(options.get('image_pool') or 0)
+        self.image_threads=int(options.get('image_threads') or 0)
+        plan=self._compile_plan(model,getattr(model,'Dilla',None),options.get('no_doubt',False),exclude=self.deferred.get(model,()))
+        together=self._unique_together(model)
+        chunk_size=batch_size or 1000
+        if options.get('loader',False):
+            if not model._meta.parents:
+                pks=self._populate_loader(model,plan,count,chunk_size,first_pk,metrics,together)
+                self._extend_pools(model,pks)
+                if self.checkpoint: self.checkpoint.batch(model,pks,row_offset+count)
+                self._finish_images()
+                return pks
+            print "%s inherits from another model, it can't be bulk loaded" % model._meta.object_name
+        pks=key_array(model._meta.pk)
+        self.created=pks
+        def batches():
+            for start in xrange(0,count,chunk_size):
+                size=min(chunk_size,count-start)
+                self._stream(label,'rows',row_offset+start)
+                yield size,self._build_instances(model,plan,size,together),row_offset+start+size
+        def write(size,instances,position):
+            if batch_size>0: instances=self._save_batch(model,instances)
+            else: instances=self._save_each(instances)
+            created=[instance.pk for instance in instances]
+            self.lock.acquire()
+            try:
+                pks.extend(created)
+                self._extend_pools(model,created)
+                metrics.add(len(created),size-len(created))
+                if self.checkpoint: self.checkpoint.batch(model,created,position)
+            finally:
+                self.lock.release()
+        writers=int(options.get('writers') or 0)
+        if writers>0:
+            self._pipeline(batches(),write,writers,int(options.get('queue_depth') or 4))
+        else:
+            for batch in batches(): write(*batch)
+        self._finish_images()
+        return pks
+
+    def _pipeline(self,batches,write,writers,depth):
+        """
+        Calls write(*batch) for every batch on writers threads, while
+        this thread goes on generating the next batches. At most depth batches
+        wait in the queue, which caps the memory used. Every thread gets its
+        own database connection and transaction state from Django, and closes
+        it when done. The first error of a writer is raised once all stopped.
+        """
+        queue=Queue.Queue(depth)
+        errors=[]
+        def drain():
+            try:
+                while True:
+                    batch=queue.get()
+                    if batch is None: return
+                    #after an error, keep draining so the generating thread never blocks
+                    if errors: continue
+                    try:
+                        write(*batch)
+                    except Exception, e:
+                        errors.append(e)
+            finally:
+                connection.close()
+        threads=[]
+        for i in range(writers):
+            thread=threading.Thread(target=drain)
+            thread.setDaemon(True)
+            thread.start()
+            threads.append(thread)
+        try:
+            for batch in batches:
+                if errors: break
+                queue.put(batch)
+        finally:
+            for thread in threads: queue.put(None)
+            for thread in threads: thread.join()
+        if errors: raise errors[0]
+
+    def _populate_parallel(self,process_pool,models,counts,options,seed,workers,metrics):
+        """
+        Shards counts[model] rows of each of models across the worker
+        processes, all models at once, and merges the primary keys and errors
+        of every model. Rows, dropped rows and queries go to metrics[model],
+        and to the checkpoint, as shards complete.
+        Returns {model:(primary keys,errors)}.
+        """
+        shards=[]
+        results={}
+        for model in models:
+            count=counts[model]
+            first_pk=None
+            if options.get('loader',False) and isinstance(model._meta.pk,AutoField):
+                #hand every shard its own range of keys, so their loads don't overlap
+                first_pk=self._next_pk(model)
+            #shards draw from the streams of their rows' positions, a resumed run starts after the last batch done
+            row_offset=0
+            if self.checkpoint: row_offset=self.checkpoint.position(model)
+            for i in range(workers):
+                shard_count=count/workers
+                if i<count%workers: shard_count+=1
+                if not shard_count: continue
+                shards.append((model,shard_count,options,seed,first_pk,row_offset,self.deferred.get(model,()),(i,workers)))
+                row_offset+=shard_count
+                if first_pk is not None: first_pk+=shard_count
+            results[model]=(key_array(model._meta.pk),[])
+        for model,shard_pks,shard_dropped,queries,error,stats,position in process_pool.imap_unordered(_populate_shard,shards):
+            pks,errors=results[model]
+            if stats and self.stats: self.stats.merge(stats)
+            pks.extend(shard_pks)
+            metrics[model].add(len(shard_pks),shard_dropped,queries)
+            if self.checkpoint: self.checkpoint.batch(model,shard_pks,position)
+            if error: errors.append(error)
+        for model in models: self._extend_pools(model,results[model][0])
+        return results
+
+    def _seed(self,seed):
+        """
+        Makes seed the master seed of the run's streams. The random module,
+        which lorem_ipsum and custom generators may use, is seeded too.
+        """
+        self.rng.master=seed
+        self.rng.stream()
+        random.seed(seed)
+        if numpy_support: numpy.random.seed(seed%4294967296)
+
+    def _stream(self,*key):
+        """
+        Switches the run's generators, and the random module, to the stream
+        of key: (model label,stage,position...)
+        """
+        self.rng.stream(*key)
+        random.seed(self.rng.derive('random',*key))
+
+    def _populate_loader(self,model,plan,count,chunk_size,first_pk=None,metrics=None,together=()):
+        """
+        Streams count generated rows of model, chunk_size rows at a time, to a
+        temporary tab delimited file and loads it with the backend's bulk
+        loader: LOAD DATA LOCAL INFILE on MySQL, COPY FROM STDIN on PostgreSQL.
+        Other backends get multi-row INSERTs per chunk instead.
+        AutoField keys are assigned from first_pk on, so the keys loaded can
+        be read back without racing other writers. Returns those keys.
+        Progress on metrics counts generated rows until the load is done.
+        """
+        if metrics is None: metrics=Metrics(model._meta.object_name,count)
+        meta=model._meta
+        qn=connection.ops.quote_name
+        fields=[f for f in meta.local_fields if not isinstance(f,AutoField)]
+        columns=[f.column for f in fields]
+        auto_pk=isinstance(meta.pk,AutoField)
+        if auto_pk:
+            columns.insert(0,meta.pk.column)
+            if first_pk is None: first_pk=self._next_pk(model)
+        engine=settings.DATABASE_ENGINE
+        native=engine.startswith('mysql') or engine.startswith('postgresql')
+        if native: datafile=tempfile.NamedTemporaryFile(prefix='dilla-',suffix='.tsv')
+        pk=first_pk
+        pks=key_array(meta.pk)
+        self.created=pks
+        #keys of the rows in the data file, known to be written once it's loaded
+        loaded=key_array(meta.pk)
+        label="%s.%s" % (meta.app_label,meta.object_name)
+        for start in xrange(0,count,chunk_size):
+            self._stream(label,'rows',self.row_offset+start)
+            rows=[]
+            keys=[]
+            for instance in self._build_instances(model,plan,min(chunk_size,count-start),together):
+                row=[f.get_db_prep_save(f.pre_save(instance,True)) for f in fields]
+                if auto_pk:
+                    row.insert(0,pk)
+                    keys.append(pk)
+                    pk+=1
+                else:
+                    keys.append(instance.pk)
+                rows.append(row)
+            if native:
+                datafile.write("".join([self._delimited_row(row) for row in rows]))
+                loaded.extend(keys)
+            else:
+                pks.extend([keys[index] for index,ignored in self._insert_rows(meta.db_table,columns,rows)])
+            metrics.add(len(rows))
+        if native:
+            datafile.flush()
+            cursor=connection.cursor()
+            if engine.startswith('mysql'):
+                #IGNORE drops rows hitting unique constraints, like the other modes do
+                cursor.execute("LOAD DATA LOCAL INFILE %%s IGNORE INTO TABLE %s CHARACTER SET utf8 (%s)" % (qn(meta.db_table),",".join([qn(c) for c in columns])),[datafile.name])
+            else:
+                datafile.seek(0)
+                cursor.copy_from(datafile,meta.db_table,columns=columns)
+            transaction.commit_unless_managed()
+            datafile.close()
+            if auto_pk:
+                #MySQL's IGNORE may have dropped some
+                cursor.execute("SELECT %s FROM %s WHERE %s BETWEEN %%s AND %%s" % (qn(meta.pk.column),qn(meta.db_table),qn(meta.pk.column)),[first_pk,pk-1])
+                for row in cursor.fetchall(): pks.append(row[0])
+            else:
+                pks.extend(loaded)
+        dropped=metrics.rows-len(pks)
+        metrics.rows-=dropped
+        metrics.add(0,dropped)
+        return pks
+
+    def _delimited_row(self,row):
+        """
+        Formats a row of database values as a tab delimited line, escaped the
+        way both LOAD DATA and COPY read it
+        """
+        line=[]
+        for value in row:
+            if value is None:
+                line.append('\\N')
+                continue
+            if value is True: value='1'
+            elif value is False: value='0'
+            elif isinstance(value,unicode): value=value.encode('utf-8')
+            else: value=str(value)
+            line.append(value.replace('\\','\\\\').replace('\t','\\t').replace('\n','\\n').replace('\r','\\r'))
+        return "\t".join(line)+"\n"
+
+    def _next_pk(self,model):
+        """
+        Returns the AutoField value following the highest one in the table
+        """
+        qn=connection.ops.quote_name
+        cursor=connection.cursor()
+        cursor.execute("SELECT MAX(%s) FROM %s" % (qn(model._meta.pk.column),qn(model._meta.db_table)))
+        return (cursor.fetchone()[0] or 0)+1
+
+    def _reset_sequences(self,model):
+        """
+        Moves the backend's key sequence past keys assigned by dilla
+        """
+        sql_list=connection.ops.sequence_reset_sql(no_style(),[model])
+        if not sql_list: return
+        cursor=connection.cursor()
+        for sql in sql_list: cursor.execute(sql)
+        transaction.commit_unless_managed()
+
+    def _save_batch(self,model,instances):
+        """
+        Saves instances with one multi-row INSERT per batch and returns the
+        ones that made it into the database, with their primary keys set.
+        Inherited models (and models with nothing but a pk) go through save().
+        """
+        meta=model._meta
+        fields=[f for f in meta.local_fields if not isinstance(f,AutoField)]
+        if meta.parents or not fields: return self._save_each(instances)
+        rows=[[f.get_db_prep_save(f.pre_save(instance,True)) for f in fields] for instance in instances]
+        auto_pk=None
+        if isinstance(meta.pk,AutoField): auto_pk=meta.pk.column
+        saved=[]
+        for index,pk in self._insert_rows(meta.db_table,[f.column for f in fields],rows,auto_pk):
+            instance=instances[index]
+            if pk is not None: setattr(instance,meta.pk.attname,pk)
+            saved.append(instance)
+        return saved
+
+    def _save_each(self,instances):
+        """
+        Saves instances one by one and returns the ones that made it in
+        """
+        saved=[]
+        for instance in instances:
+            try:
+                instance.save()
+                #if field has unique, this error will be thrown, in the case of dilla, we don't care
+            except IntegrityError:
+                continue
+            saved.append(instance)
+        return saved
+
+    def _insert_rows(self,table,columns,rows,auto_pk=None,offset=0):
+        """
+        Inserts rows with a single multi-row INSERT inside one transaction
+        (several on SQLite, which caps the parameters of a statement, and one
+        per row on backends without multi-row VALUES).
+        When the batch hits an IntegrityError it is rolled back and split in
+        halves, so only the offending rows get dropped.
+        Returns an (index,pk) tuple for every row written, pk is None unless
+        auto_pk names the table's AutoField column.
+        """
+        if not rows: return []
+        qn=connection.ops.quote_name
+        engine=settings.DATABASE_ENGINE
+        sql="INSERT INTO %s (%s) VALUES " % (qn(table),",".join([qn(c) for c in columns]))
+        values="(%s)" % ",".join(["%s"]*len(columns))
+        statement_rows=len(rows)
+        if engine=='sqlite3': statement_rows=max(SQLITE_MAX_VARIABLES/max(len(columns),1),1)
+        try:
+            cursor=connection.cursor()
+            pks=[]
+            if engine in MULTI_ROW_ENGINES:
+                for start in xrange(0,len(rows),statement_rows):
+                    chunk=rows[start:start+statement_rows]
+                    params=[]
+                    for row in chunk: params.extend(row)
+                    if auto_pk and engine.startswith('postgresql'):
+                        #other connections (writer threads, workers) draw from the same sequence
+                        cursor.execute(sql+",".join([values]*len(chunk))+" RETURNING %s" % qn(auto_pk),params)
+                        pks.extend([row[0] for row in cursor.fetchall()])
+                        continue
+                    cursor.execute(sql+",".join([values]*len(chunk)),params)
+                    if auto_pk: pks.extend(self._inserted_pks(cursor,table,auto_pk,len(chunk)))
+            elif auto_pk:
+                #keys of concurrent inserts interleave, read each row's back
+                for row in rows:
+                    cursor.execute(sql+values,row)
+                    pks.append(connection.ops.last_insert_id(cursor,table,auto_pk))
+            else:
+                cursor.executemany(sql+values,rows)
+            if not auto_pk: pks=[None]*len(rows)
+            transaction.commit_unless_managed()
+        except IntegrityError:
+            transaction.rollback_unless_managed()
+            if len(rows)==1: return []
+            half=len(rows)/2
+            return self._insert_rows(table,columns,rows[:half],auto_pk,offset)+self._insert_rows(table,columns,rows[half:],auto_pk,offset+half)
+        return zip(range(offset,offset+len(rows)),pks)
+
+    def _inserted_pks(self,cursor,table,pk_column,count):
+        """
+        Primary keys handed out by the last multi-row INSERT. MySQL reports the
+        first id of the statement, SQLite the last one. Both hand a statement
+        consecutive keys, SQLite locks the database for the statement and
+        MySQL does with innodb_autoinc_lock_mode 0 or 1 (its default before
+        8.0). PostgreSQL keys come from INSERT ... RETURNING instead.
+        """
+        last=connection.ops.last_insert_id(cursor,table,pk_column)
+        if settings.DATABASE_ENGINE.startswith('mysql'): return range(last,last+count)
+        if last is None:
+            qn=connection.ops.quote_name
+            cursor.execute("SELECT MAX(%s) FROM %s" % (qn(pk_column),qn(table)))
+            last=cursor.fetchone()[0]
+        return range(last-count+1,last+1)
+
+    def _pk_pool(self,model,field_name=None):
+        """
+        Returns the run's key pool for model, loading it on first use
+        """
+        if not field_name: field_name=model._meta.pk.name
+        key=(model,field_name)
+        pool=self.pk_pools.get(key,None)
+        if pool is None:
+            #exports only point to rows of the same file
+            if self.exporting and field_name==model._meta.pk.name and isinstance(model._meta.pk,AutoField): pool=RangePool(1,self.rng)
+            else: pool=PkPool(model,field_name,self.fk_pool_size,self.rng,not self.exporting)
+            self.pk_pools[key]=pool
+        return pool
+
+    def _extend_pools(self,model,pks):
+        """
+        Adds the primary keys of freshly saved rows to the pools already
+        loaded for model. Pools on other key columns are reloaded on next use.
+        """
+        for key,pool in self.pk_pools.items():
+            if key[0] is not model: continue
+            if key[1]==model._meta.pk.name: pool.extend(pks)
+            else: del self.pk_pools[key]
+
+    def _lorem(self):
+        """
+        Returns the run's LoremCorpus, building it on first use
+        """
+        if self.corpus is None: self.corpus=LoremCorpus(rng=self.rng)
+        return self.corpus
 
     def _get_field_option(self,field_extras,option_name,default):
         """
@@ -186,6 +1814,49 @@ class Command(BaseCommand):
         if not field_extras: return default
         return field_extras.get(option_name,default)
 
+    def _integer_range(self,field_extras,default,positive_name=None):
+        """
+        Shortcut to get the 'integer_range' field option, positive_name
+        rejects negative ranges for the Positive*Field types
+        """
+        ranj=self._get_field_option(field_extras,"integer_range",default)
+        if len(ranj)<2:ranj=default
+        if positive_name and (ranj[0]<0 or ranj[1]<0):
+            print "%s ranges cannot be less than zero, defaulting to range(%d,%d)" % (positive_name,default[0],default[1])
+            ranj=default
+        return ranj
+
+    def _distribution(self,field_extras):
+        """
+        Returns the run's Distribution for the 'distribution' field option,
+        or None to draw uniformly
+        """
+        spec=self._get_field_option(field_extras,'distribution',None)
+        if not spec or spec=='uniform': return None
+        if isinstance(spec,list): spec=tuple(spec)
+        distribution=self.distributions.get(spec,None)
+        if distribution is None:
+            distribution=Distribution(spec,self.rng)
+            self.distributions[spec]=distribution
+        return distribution
+
+    def _draw(self,field_extras,low,high):
+        """
+        Returns an integer in [low,high], following the field's distribution
+        """
+        distribution=self._distribution(field_extras)
+        if distribution is None: return self.rng.randint(low,high)
+        return low+distribution.index(high-low+1)
+
+    def _draw_column(self,field_extras,low,high,count):
+        """
+        Returns a numpy array of count integers in [low,high], following the
+        field's distribution
+        """
+        distribution=self._distribution(field_extras)
+        if distribution is None: return self.rng.numpy.randint(low,high+1,count)
+        return low+distribution.column(high-low+1,count)
+
     def hashkey(self,**kwargs):
         """
         Gererates an md5 hashkey. Use this with the 'generator' key, EX:
@@ -195,11 +1866,9 @@ class Command(BaseCommand):
             }
         }
         """
-        import md5
-        m=md5.new()
-        m.update(str(time.clock()))
-        m.update(str(random.random()))
-        m.update(str(random.random()))
+        m=hashlib.md5()
+        m.update(str(self.rng.getrandbits(64)))
+        m.update(str(self.rng.getrandbits(64)))
         m.update(settings.SECRET_KEY)
         return m.hexdigest()
 
@@ -213,7 +1882,8 @@ class Command(BaseCommand):
         }
         """
         import uuid
-        return str(uuid.uuid1())
+        #a version 4 uuid from the run's stream, so seeded runs repeat it
+        return str(uuid.UUID(int=self.rng.getrandbits(128),version=4))
 
     def extended_zip(self,**kwargs):
         """
@@ -224,8 +1894,8 @@ class Command(BaseCommand):
             }
         }
         """
-        int1=random.randint(11111,99999)
-        int2=random.randint(1111,9999)
+        int1=self.rng.randint(11111,99999)
+        int2=self.rng.randint(1111,9999)
         return str(int1)+"-"+str(int2)
         
     def phonenumber(self,**kwargs):
@@ -237,9 +1907,9 @@ class Command(BaseCommand):
             }
         }
         """
-        int1=random.randint(111,999)
-        int2=random.randint(111,999)
-        int3=random.randint(111,999)
+        int1=self.rng.randint(111,999)
+        int2=self.rng.randint(111,999)
+        int3=self.rng.randint(111,999)
         return str(int1)+"-"+str(int2)+"-"+str(int3)
         
     def sip_URI(self,**kwargs):
@@ -251,7 +1921,7 @@ class Command(BaseCommand):
             }
         }
         """
-        int1=random.randint(11111111,999999999)
+        int1=self.rng.randint(11111111,999999999)
         return "SIP/"+str(int1)+"@siptrunk"
 
     def zip(self,**kwargs):
@@ -263,30 +1933,52 @@ class Command(BaseCommand):
             }
         }
         """
-        int1=random.randint(11111,99999)
+        int1=self.rng.randint(11111,99999)
         return str(int1)
 
 
-    def many_to_manys(self,model,instances,dilla=None):
+    def many_to_manys(self,model,pks,dilla=None,batch_size=1000,options=None):
         """
-        Creates data for many to many fields
+        Creates data for many to many fields. Related keys are sampled from the
+        run's key pools, as many per row as _fan_out() says, and the through
+        table rows for all the given primary keys are deduplicated and
+        inserted batch_size rows at a time.
         """
-        many_to_manys=model._meta.many_to_many
-        for instance in instances:
-            for many_to_many_field in many_to_manys:
-                max=5
-                name=many_to_many_field.name
-                if dilla and hasattr(dilla,"field_extras"):
-                    field_extras=dilla.field_extras.get(name,None)
-                    if field_extras: max=field_extras.get("max",5)
-                ml=many_to_many_field.rel.to
-                objects=ml.objects.all().order_by("?")
-                count=objects.count()
-                end=random.randrange(0,max)
-                if count<end:relobjs=objects[0:count]
-                else: relobjs=objects[0:end]
-                setattr(instance,name,relobjs)
-                instance.save
+        for many_to_many_field in model._meta.many_to_many:
+            name=many_to_many_field.name
+            low,high=self._fan_out(model,many_to_many_field,dilla)
+            if has_intermediary(many_to_many_field):
+                print 'Skipping many to many field with an intermediary model: %s' % name
+                continue
+            metrics=self._metrics("%s.%s" % (model._meta.object_name,name),None,options or {},'m2m')
+            pool=self._pk_pool(many_to_many_field.rel.to)
+            #symmetrical relations are stored in both directions, so pairs can repeat across rows
+            symmetrical=many_to_many_field.rel.to==model and getattr(many_to_many_field.rel,'symmetrical',False)
+            seen=set()
+            table=many_to_many_field.m2m_db_table()
+            columns=(many_to_many_field.m2m_column_name(),many_to_many_field.m2m_reverse_name())
+            rows=[]
+            self._stream(model._meta.app_label,model._meta.object_name,name,'m2m')
+            for pk in pks:
+                end=self.rng.randint(low,high)
+                if len(pool)<=end: related=set(pool.pks)
+                else:
+                    related=set()
+                    while len(related)<end: related.add(pool.sample())
+                for related_pk in related:
+                    pairs=[(pk,related_pk)]
+                    if symmetrical:
+                        if pk!=related_pk: pairs.append((related_pk,pk))
+                        pairs=[pair for pair in pairs if pair not in seen]
+                        seen.update(pairs)
+                    rows.extend(pairs)
+                if len(rows)>=batch_size:
+                    written=len(self._insert_rows(table,columns,rows))
+                    metrics.add(written,len(rows)-written)
+                    rows=[]
+            written=len(self._insert_rows(table,columns,rows))
+            metrics.add(written,len(rows)-written)
+            metrics.finish()
     
     def generate_PositiveIntegerField(self,**kwargs):
         """
@@ -294,17 +1986,13 @@ class Command(BaseCommand):
         Supported field extras:
         field_extras={
             'myfield':{
-                'integer_range':(0,10) #specify the integer range to generate
+                'integer_range':(0,10), #specify the integer range to generate
+                'distribution':'zipf' #how values spread over the range, see Distribution
             }
         }
         """
-        field_extras=kwargs.get("field_extras",False)
-        ranj=self._get_field_option(field_extras,"integer_range",(0,32))
-        if len(ranj)<2:ranj=(0,32)
-        if ranj[0]<0 or ranj[1]<0:
-            print "PositiveInteger ranges cannot be less than zero, defaulting to range(0,32)"
-            ranj=(0,32)
-        return random.randint(ranj[0],ranj[1])
+        ranj=self._integer_range(kwargs.get("field_extras",False),(0,32),"PositiveInteger")
+        return self._draw(kwargs.get("field_extras",False),ranj[0],ranj[1])
     
     def generate_PositiveSmallIntegerField(self,**kwargs):
         """
@@ -312,17 +2000,13 @@ class Command(BaseCommand):
         Supported field extras:
         field_extras={
             'myfield':{
-                'integer_range':(0,10) #specify the integer range to generate
+                'integer_range':(0,10), #specify the integer range to generate
+                'distribution':'zipf' #how values spread over the range, see Distribution
             }
         }
         """
-        field_extras=kwargs.get("field_extras",False)
-        ranj=self._get_field_option(field_extras,"integer_range",(0,32))
-        if len(ranj)<2:ranj=(0,32)
-        if ranj[0]<0 or ranj[1]<0:
-            print "PositiveSmallInteger ranges cannot be less than zero, defaulting to range(0,32)"
-            ranj=(0,32)
-        return random.randint(ranj[0],ranj[1])
+        ranj=self._integer_range(kwargs.get("field_extras",False),(0,32),"PositiveSmallInteger")
+        return self._draw(kwargs.get("field_extras",False),ranj[0],ranj[1])
     
     def generate_SmallIntegerField(self,**kwargs):
         """
@@ -330,14 +2014,13 @@ class Command(BaseCommand):
         Supported field extras:
         field_extras={
             'myfield':{
-                'integer_range':(0,10) #specify the integer range to generate
+                'integer_range':(0,10), #specify the integer range to generate
+                'distribution':'zipf' #how values spread over the range, see Distribution
             }
         }
         """
-        field_extras=kwargs.get("field_extras",False)
-        ranj=self._get_field_option(field_extras,"integer_range",(0,32))
-        if len(ranj)<2:ranj=(0,32)
-        return random.randint(ranj[0],ranj[1])
+        ranj=self._integer_range(kwargs.get("field_extras",False),(0,32))
+        return self._draw(kwargs.get("field_extras",False),ranj[0],ranj[1])
     
     def generate_URLField(self,**kwargs):
         """
@@ -350,13 +2033,13 @@ class Command(BaseCommand):
             "http://www.nba.com/","http://www.espn.com/","http://www.python.org/",
         )
         urls=getattr(settings,"DILLA_URLS",urls)
-        return urls[random.randrange(0,len(urls))]
+        return urls[self.rng.randrange(0,len(urls))]
     
     def generate_IPAddressField(self,**kwargs):
         """
         Generates a random IP Address
         """
-        ip=str(random.randrange(0,255))+"."+str(random.randrange(0,255))+"."+str(random.randrange(0,255))+"."+str(random.randrange(0,255))
+        ip=str(self.rng.randrange(0,255))+"."+str(self.rng.randrange(0,255))+"."+str(self.rng.randrange(0,255))+"."+str(self.rng.randrange(0,255))
         return ip
         
     def generate_CharField(self,**kwargs):
@@ -373,21 +2056,22 @@ class Command(BaseCommand):
         """
         salt=""
         field_extras=kwargs.get("field_extras",False)
-        if kwargs.get('unique',False): salt="".join([random.choice(string.digits) for i in range(random.randint(1,16))])
+        if kwargs.get('unique',False): salt="".join([self.rng.choice(string.digits) for i in range(self.rng.randint(1,16))])
         word_count=self._get_field_option(field_extras,'word_count',-1)
         word_range=self._get_field_option(field_extras,'word_range',-1)
+        lorem=self._lorem()
         if isinstance(word_range,tuple) and len(word_range)>1:
-            result="%s %s" % (words(random.randint(word_range[0],word_range[1]),common=False),salt)
+            result="%s %s" % (lorem.words(self.rng.randint(word_range[0],word_range[1])),salt)
         elif word_count > 0:
-            result="%s %s" % (words(word_count,common=False),salt)
+            result="%s %s" % (lorem.words(word_count),salt)
         else:
-            result="%s %s" % (words(random.randint(1,4),common=False),salt)
+            result="%s %s" % (lorem.words(self.rng.randint(1,4)),salt)
         max_length=kwargs.get('max_length',None)
         length=len(result)
         if max_length and length > max_length: result=result[length-max_length:] #chop off too many chars for max length
         if not self._get_field_option(field_extras,"spaces",True) and word_count == -1 and word_range == -1:
             result=result.replace(" ","")
-        result=re.sub(r' $','',result)
+        if result.endswith(" "): result=result[:-1]
         return result
     
     def generate_TextField(self,**kwargs):
@@ -405,27 +2089,38 @@ class Command(BaseCommand):
         field_extras=kwargs.get("field_extras",False)
         paragraph_count=self._get_field_option(field_extras,'paragraph_count',-1)
         paragraph_range=self._get_field_option(field_extras,'paragraph_range',-1)
+        lorem=self._lorem()
         if isinstance(paragraph_range,tuple) and len(paragraph_range)>1:
-            result="\n".join(paragraphs(random.randint(paragraph_range[0],paragraph_range[1])))
+            result="\n".join(lorem.paragraphs(self.rng.randint(paragraph_range[0],paragraph_range[1])))
         elif paragraph_count > 0:
-            result="\n".join(paragraphs(paragraph_count))
+            result="\n".join(lorem.paragraphs(paragraph_count))
         else:
-            result="\n".join(paragraphs(random.randint(1,3)))
-        if not self._get_field_option(field_extras,'spaces',True): result=result.resplace(" ","")
-        result=re.sub(r' $','',result)
+            result="\n".join(lorem.paragraphs(self.rng.randint(1,3)))
+        if not self._get_field_option(field_extras,'spaces',True): result=result.replace(" ","")
+        max_length=kwargs.get('max_length',None)
+        if max_length and len(result) > max_length: result=result[:max_length]
+        if result.endswith(" "): result=result[:-1]
         return result
     
     def generate_DecimalField(self,**kwargs):
         """
         Generates a random decimal number
         """
-        return Decimal(str(random.random()+random.randint(1,20)))
+        return Decimal(str(self.rng.random()+self.rng.randint(1,20)))
     
     def generate_IntegerField(self,**kwargs):
         """
         Generates a random integer
+        Supported field extras:
+        field_extras={
+            'myfield':{
+                'integer_range':(0,10), #specify the integer range to generate, (1,255) by default
+                'distribution':('normal',0.5,0.1) #how values spread over the range, see Distribution
+            }
+        }
         """
-        return random.randint(1,255)
+        ranj=self._integer_range(kwargs.get("field_extras",False),(1,255))
+        return self._draw(kwargs.get("field_extras",False),ranj[0],ranj[1])
     
     def generate_TimeField(self,**kwargs):
         """
@@ -442,6 +2137,7 @@ class Command(BaseCommand):
             'myfield':{
                 'day_delta': 5, #The day delta to generate the date, minus today
                 'hour_delta': 24, #The day delta to generate the date, minus the current hour
+                'distribution': 'exponential', #how the days spread over day_delta, see Distribution
             }
         }
         """
@@ -450,8 +2146,8 @@ class Command(BaseCommand):
         hour_delta_setting = self._get_field_option(field_extras,'hour_delta', 0)
         
         #return datetime.datetime.now()
-        day_delta = random.randint(0, day_delta_setting)
-        hour_delta = random.randint(0, hour_delta_setting)
+        day_delta = self._draw(field_extras, 0, day_delta_setting)
+        hour_delta = self.rng.randint(0, hour_delta_setting)
         
         today = datetime.datetime.today()
         one_day = datetime.timedelta(days=1)
@@ -468,115 +2164,440 @@ class Command(BaseCommand):
     
     def generate_ForeignKey(self, **kwargs):
         """
-        Finds a random foreign related object.
+        Picks a random key of the related model from the run's key pool.
+        fill() assigns it to the field's attname (<field>_id) directly.
+        Supported field extras:
+        field_extras={
+            'myfield':{
+                'distribution':('zipf',1.2) #a few hot keys get most rows, see Distribution
+            }
+        }
         """
         field=kwargs.get('field',None)
         if not field: return None
-        kls=field.rel.to
-        try:
-            related_object=kls.objects.all().order_by('?')[0]
-            return related_object
-        except IndexError:
+        pk=self._pk_pool(field.rel.to,field.rel.field_name).sample(self._distribution(kwargs.get('field_extras',False)))
+        if pk is None:
             print "Couldn't find a related object for ForeignKey: %s" % field.name
-            return None
+        return pk
     
     def generate_SlugField(self,**kwargs):
         """
         Generates a slug for SlugField's
         """
         result=self.generate_CharField(**kwargs).replace(" ","_")
-        result=re.sub(r'_$',"",result)
+        if result.endswith("_"): result=result[:-1]
         return result
     
     def generate_BooleanField(self,**kwargs):
         """
         Generates a boolean for BooleanField's
         """
-        return bool(random.randint(0,1))
+        return bool(self.rng.randint(0,1))
     
     def generate_EmailField(self,**kwargs):
         """
         Generates a random lipsum email address.
         """
-        front=words(1,common=False)
-        back=words(1,common=False)
+        lorem=self._lorem()
+        front=lorem.word()
+        back=lorem.word()
         #side to side
-        email=front+str(random.randint(1000,9999))+"@"+back+".com"
+        email=front+str(self.rng.randint(1000,9999))+"@"+back+".com"
         return email
     
-    def _decide(self,action,*args,**kwargs):
+    def column_IntegerField(self,count,**kwargs):
+        """
+        Generates count values for an IntegerField at once
+        """
+        if not numpy_support: return [self.generate_IntegerField(**kwargs) for i in xrange(count)]
+        ranj=self._integer_range(kwargs.get("field_extras",False),(1,255))
+        return self._draw_column(kwargs.get("field_extras",False),ranj[0],ranj[1],count).tolist()
+    
+    def column_PositiveIntegerField(self,count,**kwargs):
+        """
+        Generates count values for a PositiveIntegerField at once
+        """
+        if not numpy_support: return [self.generate_PositiveIntegerField(**kwargs) for i in xrange(count)]
+        ranj=self._integer_range(kwargs.get("field_extras",False),(0,32),"PositiveInteger")
+        return self._draw_column(kwargs.get("field_extras",False),ranj[0],ranj[1],count).tolist()
+    
+    def column_PositiveSmallIntegerField(self,count,**kwargs):
+        """
+        Generates count values for a PositiveSmallIntegerField at once
+        """
+        if not numpy_support: return [self.generate_PositiveSmallIntegerField(**kwargs) for i in xrange(count)]
+        ranj=self._integer_range(kwargs.get("field_extras",False),(0,32),"PositiveSmallInteger")
+        return self._draw_column(kwargs.get("field_extras",False),ranj[0],ranj[1],count).tolist()
+    
+    def column_SmallIntegerField(self,count,**kwargs):
+        """
+        Generates count values for a SmallIntegerField at once
+        """
+        if not numpy_support: return [self.generate_SmallIntegerField(**kwargs) for i in xrange(count)]
+        ranj=self._integer_range(kwargs.get("field_extras",False),(0,32))
+        return self._draw_column(kwargs.get("field_extras",False),ranj[0],ranj[1],count).tolist()
+    
+    def column_DecimalField(self,count,**kwargs):
+        """
+        Generates count values for a DecimalField at once
+        """
+        if not numpy_support: return [self.generate_DecimalField(**kwargs) for i in xrange(count)]
+        values=self.rng.numpy.random_sample(count)+self.rng.numpy.randint(1,21,count)
+        return [Decimal(str(value)) for value in values.tolist()]
+    
+    def column_BooleanField(self,count,**kwargs):
+        """
+        Generates count values for a BooleanField at once
+        """
+        if not numpy_support: return [self.generate_BooleanField(**kwargs) for i in xrange(count)]
+        return self.rng.numpy.randint(0,2,count).astype(bool).tolist()
+    
+    def column_IPAddressField(self,count,**kwargs):
+        """
+        Generates count IP Addresses at once
+        """
+        if not numpy_support: return [self.generate_IPAddressField(**kwargs) for i in xrange(count)]
+        return ["%d.%d.%d.%d" % tuple(ip) for ip in self.rng.numpy.randint(0,255,(count,4)).tolist()]
+    
+    def column_DateTimeField(self,count,**kwargs):
+        """
+        Generates count datetimes at once, honouring 'day_delta' and 'hour_delta'
+        """
+        if not numpy_support: return [self.generate_DateTimeField(**kwargs) for i in xrange(count)]
+        field_extras=kwargs.get("field_extras",False)
+        day_delta_setting=self._get_field_option(field_extras,'day_delta',0)
+        hour_delta_setting=self._get_field_option(field_extras,'hour_delta',0)
+        seconds=self._draw_column(field_extras,0,day_delta_setting,count)*86400+self.rng.numpy.randint(0,hour_delta_setting+1,count)*3600
+        today=numpy.datetime64(datetime.datetime.today(),'us')
+        return (today-seconds.astype('timedelta64[s]')).tolist()
+    
+    def column_TimeField(self,count,**kwargs):
         """
-        Decides whether or not to give a blank field a value
+        Generates count values for a TimeField at once
         """
-        if bool(random.randint(0,1)):return action(*args,**kwargs)
+        return [self.generate_TimeField(**kwargs)]*count
     
     def _generate_image(self, resolution):
         """
-        Generates image
+        Generates image. With --image-pool, only the first images of each
+        resolution are rendered, the next ones are hard links (or copies) of
+        those. With --image-threads, PNGs are written in the background.
+        """
+        assert load_images()
+        filename="%s.png" % self.generate_SlugField(unique=True)
+        path="%s%s"%(FAKE_UPLOAD_PATH,filename)
+        if self.image_pool_size:
+            pool=self.image_pools.setdefault(resolution,[])
+            if len(pool)>=self.image_pool_size:
+                source=pool[self.rng.randrange(0,len(pool))]
+                try:
+                    os.link(source,path)
+                except OSError:
+                    shutil.copyfile(source,path)
+                return filename
+            #pooled images are written right away, so they can be linked to
+            self._render_image(resolution).save(path,'PNG')
+            pool.append(path)
+            return filename
+        im=self._render_image(resolution)
+        if self.image_threads:
+            if not self.image_writer: self.image_writer=ImageWriter(self.image_threads)
+            self.image_writer.save(im,path)
+        else:
+            im.save(path,'PNG')
+        return filename
+    
+    def _render_image(self,resolution):
+        """
+        Draws a random image, fonts come from the font cache
         """
-        assert image_support
         size=map(int,resolution.split('x'))
         im=Image.new('RGB',size)
         draw=ImageDraw.Draw(im)
         def _gen_rgb():
-            return "rgb%s" % str(tuple([random.randint(0,255) for i in range(3)]))    
+            return "rgb%s" % str(tuple([self.rng.randint(0,255) for i in range(3)]))    
         text_pos=(0,0)
-        text=[random.choice(string.letters) for i in range(2)]
+        text=[self.rng.choice(string.letters) for i in range(2)]
         draw.rectangle([(0,0),tuple(size)],fill=_gen_rgb())
         for i in range(2):
-            fontfile=random.choice(fonts)
-            font=ImageFont.truetype("%s/fonts/%s" %(ROOT,fontfile), size[0],encoding=TTF_ENCODING)
-            draw.text(text_pos, text[i],fill=_gen_rgb(),font=font)
-            del font
-        filename="%s.png" % self.generate_SlugField(unique=True)
-        im.save("%s%s"%(FAKE_UPLOAD_PATH,filename),'PNG')
-        del draw,im
-        return filename
+            draw.text(text_pos, text[i],fill=_gen_rgb(),font=self._font(self.rng.choice(fonts),size[0]))
+        del draw
+        return im
+    
+    def _font(self,fontfile,size):
+        """
+        Returns a loaded font, parsing the font file only once per size
+        """
+        font=font_cache.get((fontfile,size),None)
+        if font is None:
+            font=ImageFont.truetype("%s/fonts/%s" %(ROOT,fontfile),size,encoding=TTF_ENCODING)
+            font_cache[(fontfile,size)]=font
+        return font
+    
+    def _finish_images(self):
+        """
+        Waits for the background image writer to write every queued image
+        """
+        if not self.image_writer: return
+        self.image_writer.join()
+        for error in self.image_writer.errors: print "Couldn't write image %s" % error
+        self.image_writer.errors=[]
     
     def fill(self,field,obj,dilla=None):
         """
         Does the work to fill model instances with random data
         """
-        val=None
+        generator=self._field_generator(field,dilla)
+        if generator is None:
+            print 'Skipping field: %s' % field.name
+            return
+        name,generate,column,generator_name=generator
+        if self.stats: generate,column=self.stats.wrap(obj.__class__,field.name,generator_name,generate)
+        setattr(obj,name,generate())
+    
+    def _compile_plan(self,model,dilla=None,no_doubt=False,exclude=(),only=None):
+        """
+        Compiles the fields of a model once per run into (name,generate,column,
+        decide) tuples, so filling rows only calls ready-made closures. column
+        is set when a whole column of values can be generated at once, decide
+        for blank fields, which only get a value half of the time.
+        exclude and only filter the fields by attname.
+        """
+        plan=[]
+        for field in model._meta.fields:
+            if field.auto_created: continue
+            if field.attname in exclude or (only is not None and field.attname not in only): continue
+            generator=self._field_generator(field,dilla)
+            if generator is None:
+                print 'Skipping field: %s' % field.name
+                continue
+            name,generate,column,generator_name=generator
+            if field.unique and not field.primary_key:
+                generate=self._unique_generator(model,field,generate)
+                column=None
+            if self.stats: generate,column=self.stats.wrap(model,field.name,generator_name,generate,column)
+            decide=field.blank and not (no_doubt or hasattr(field,"auto_now") or hasattr(field,"auto_now_add"))
+            plan.append((name,generate,column,decide))
+        return plan
+    
+    def _unique_generator(self,model,field,generate):
+        """
+        Wraps the generator of a unique field so it never repeats a value,
+        without relying on IntegrityErrors:
+        - integer fields count up from the highest value in the table,
+        - string fields get a suffix mixing a token for this run (and shard)
+          with a counter, the generated text is cut to fit max_length,
+        - anything else is regenerated until it isn't in the table or in
+          this run yet, keeping hashes of the values seen.
+        """
+        internal_type=field.get_internal_type()
+        manager=model._default_manager
+        if internal_type in UNIQUE_INTEGER_TYPES:
+            highest=manager.aggregate(highest=Max(field.name))['highest'] or 0
+            return itertools.count(highest+1+self.row_offset).next
+        if internal_type in UNIQUE_STRING_TYPES:
+            #the row count changes between runs, so reusing a seed doesn't reuse a token
+            token=base36(self.rng.getrandbits(32)^manager.count())
+            counter=itertools.count(self.row_offset)
+            max_length=field.max_length
+            def generate_unique():
+                suffix="-%s%s" % (token,base36(counter.next()))
+                if max_length and len(suffix)>max_length: suffix=suffix[-max_length:]
+                value=generate() or u''
+                if internal_type=='EmailField' and '@' in value:
+                    local,domain=value.split('@',1)
+                    if max_length: local=local[:max(max_length-len(suffix)-len(domain)-1,0)]
+                    return u"%s%s@%s" % (local,suffix,domain)
+                if max_length: value=value[:max_length-len(suffix)]
+                return value+suffix
+            return generate_unique
+        seen=set([hash(value) for value in manager.values_list(field.attname,flat=True).iterator()])
+        def generate_unseen():
+            for attempt in xrange(UNIQUE_ATTEMPTS):
+                value=generate()
+                if hash(value) not in seen: break
+            seen.add(hash(value))
+            return value
+        return generate_unseen
+    
+    def _unique_together(self,model):
+        """
+        Returns (attnames,seen hashes) for each unique_together constraint of
+        model, with the combinations already in the table marked as seen
+        """
+        meta=model._meta
+        together=[]
+        for names in meta.unique_together:
+            attnames=[meta.get_field(name).attname for name in names]
+            rows=model._default_manager.values_list(*attnames).iterator()
+            together.append((attnames,set([hash(tuple(row)) for row in rows])))
+        return together
+    
+    def _build_instances(self,model,plan,count,together=(),fill=None):
+        """
+        Builds count unsaved instances of model, or rows with fill=_fill_rows.
+        Rows repeating a combination of a unique_together constraint are
+        replaced by new ones, up to UNIQUE_ATTEMPTS times (times the shards
+        for a worker shard), so all count rows are valid in the end.
+        """
+        if fill is None: fill=self._fill_instances
+        instances=fill(model,plan,count)
+        if not together: return instances
+        instances=[instance for instance in instances if self._claim_unique(instance,together)]
+        attempts=UNIQUE_ATTEMPTS
+        if self.shard: attempts*=self.shard[1]
+        for attempt in xrange(attempts):
+            if len(instances)==count: break
+            extra=fill(model,plan,count-len(instances))
+            instances.extend([instance for instance in extra if self._claim_unique(instance,together)])
+        return instances
+    
+    def _claim_unique(self,instance,together):
+        """
+        Marks the unique_together combinations of instance as seen, unless
+        one of them was seen already. Worker shards don't see each other's
+        rows, so each one only claims the combinations whose hash falls in
+        its own share of the value space.
+        """
+        keys=[]
+        if isinstance(instance,dict): value=instance.get
+        else: value=lambda attname: getattr(instance,attname)
+        for attnames,seen in together:
+            key=hash(tuple([value(attname) for attname in attnames]))
+            if key in seen: return False
+            if self.shard and key%self.shard[1]!=self.shard[0]: return False
+            keys.append(key)
+        for (attnames,seen),key in zip(together,keys): seen.add(key)
+        return True
+    
+    def _fill_instances(self,model,plan,count):
+        """
+        Fills count unsaved instances of model from its compiled plan, one
+        field at a time, so column generators produce all values in one call
+        """
+        instances=[model() for i in xrange(count)]
+        for name,generate,column,decide in plan:
+            rows=xrange(count)
+            if decide: rows=[i for i in rows if self.rng.randint(0,1)]
+            if column: values=column(len(rows))
+            else: values=[generate() for i in rows]
+            for i,val in zip(rows,values): setattr(instances[i],name,val)
+        return instances
+    
+    def _fill_rows(self,model,plan,count):
+        """
+        Like _fill_instances(), but fills dicts of values by attname, starting
+        from the fields' defaults, without instantiating the model
+        """
+        fields=model._meta.fields
+        rows=[dict([(f.attname,f.get_default()) for f in fields]) for i in xrange(count)]
+        for name,generate,column,decide in plan:
+            indexes=xrange(count)
+            if decide: indexes=[i for i in indexes if self.rng.randint(0,1)]
+            if column: values=column(len(indexes))
+            else: values=[generate() for i in indexes]
+            for i,val in zip(indexes,values): rows[i][name]=val
+        return rows
+
+    def _field_generator(self,field,dilla=None):
+        """
+        Resolves everything needed to generate a field's value: field extras,
+        skip and image settings, custom generators and the generate_* method.
+        Returns (attribute name,closure,column closure or None,generator name),
+        or None if the field is skipped.
+        Like before, a custom generator wins over images, which win over
+        random_values, and the generate_* method fills in falsy values.
+        """
         field_extras=None
+        primary=None
+        primary_name=None
         if dilla:
             field_extras=getattr(dilla,'field_extras',None)
             if field_extras:field_extras=field_extras.get(field.name,None)
             skip_fields=getattr(dilla,'skip_fields',None)
-            if skip_fields and field.name in skip_fields:
-                print 'Skipping field: %s' % field.name
-                return
+            if skip_fields and field.name in skip_fields: return None
             if field_extras and field_extras.get("random_values",None):
                 vals=field_extras.get('random_values')
-                val=vals[random.randrange(0,len(vals))]
+                weights=field_extras.get('weights',None)
+                distribution=self._distribution(field_extras)
+                if weights and len(weights)==len(vals):
+                    table=AliasTable(weights,self.rng)
+                    primary=lambda: vals[table.sample()]
+                elif distribution:
+                    primary=lambda: vals[distribution.index(len(vals))]
+                else:
+                    if weights: print "%s has %d weights for %d random_values, ignoring them" % (field.name,len(weights),len(vals))
+                    primary=lambda: vals[self.rng.randrange(0,len(vals))]
+                primary_name='random_values'
             image_fields=getattr(dilla,'image_fields',None)
             generate_images=getattr(dilla,'generate_images',False)
-            if image_fields and generate_images and field.name in image_fields:
-                resolution=getattr(obj.Dilla,'resolution','640x480')
-                resolutions=getattr(obj.Dilla,'resolutions',None)
-                if resolutions:
-                    resolution=obj.Dilla.resolutions[random.randrange(0,len(obj.Dilla.resolutions))]
-                if field_extras:
-                    resolution=field_extras.get("resolution","800x600")
-                    if field_extras.get("resolutions",None):
-                        sizes=field_extras.get("resolutions",None)
-                        if sizes: resolution=sizes[random.randrange(0,len(sizes))]
-                    else: resolution="800x600"
-                if(image_support):val=self._generate_image(resolution)
+            if image_fields and generate_images and field.name in image_fields and load_images():
+                if field_extras: resolutions=field_extras.get("resolutions",None) or ("800x600",)
+                else: resolutions=getattr(dilla,'resolutions',None) or (getattr(dilla,'resolution','640x480'),)
+                primary=lambda: self._generate_image(resolutions[self.rng.randrange(0,len(resolutions))])
+                primary_name='_generate_image'
         if field_extras:
             generator=field_extras.get("generator",None)
             if callable(generator):
-                if field_extras.get("generator_wants_extras",None):val=generator(field_extras)
-                else: val=generator()
-            elif isinstance(generator,str):
-                if hasattr(self,generator):
-                    method=getattr(self,generator)
-                    val=method()
-        if not val:
-            internal_type=field.get_internal_type()
-            if isinstance(field,URLField):
-                val=self.generate_URLField(field=field,unique=field.unique,max_length=field.max_length,field_extras=field_extras)
-            elif hasattr(self,"generate_%s"%internal_type):
-                generate_method=getattr(self,"generate_%s"%internal_type)
-                val=generate_method(field=field,unique=field.unique,max_length=field.max_length,field_extras=field_extras)
-        setattr(obj,field.name,val)
+                if field_extras.get("generator_wants_extras",None): primary=lambda: generator(field_extras)
+                else: primary=generator
+                primary_name=getattr(generator,'__name__','generator')
+            elif isinstance(generator,str) and hasattr(self,generator):
+                primary=getattr(self,generator)
+                primary_name=generator
+        name=field.name
+        internal_type=field.get_internal_type()
+        generate_method=None
+        if isinstance(field,URLField): generate_method=self.generate_URLField
+        elif hasattr(self,"generate_%s"%internal_type): generate_method=getattr(self,"generate_%s"%internal_type)
+        column=None
+        if generate_method:
+            kwargs=dict(field=field,unique=field.unique,max_length=field.max_length,field_extras=field_extras)
+            default=lambda: generate_method(**kwargs)
+            if hasattr(self,"column_%s"%internal_type) and not isinstance(field,URLField):
+                column_method=getattr(self,"column_%s"%internal_type)
+                column=lambda count: column_method(count,**kwargs)
+        else:
+            default=lambda: None
+        if internal_type=='ForeignKey':
+            #keys are assigned to <field>_id, so related objects from custom generators are turned into keys
+            name=field.attname
+            if primary:
+                to_attname=field.rel.get_related_field().attname
+                custom=primary
+                def primary():
+                    val=custom()
+                    if hasattr(val,'_meta'): val=getattr(val,to_attname)
+                    return val
+        default_name=generate_method and generate_method.__name__ or 'None'
+        if primary is None: return name,default,column,default_name
+        def generate():
+            val=primary()
+            if not val: val=default()
+            return val
+        return name,generate,None,primary_name
+
+def _populate_shard(args):
+    """
+    Runs in a worker process: populates one shard of a model with the
+    worker's own connection, random stream and batched writer
+    """
+    model,count,options,seed,first_pk,row_offset,deferred,shard=args
+    load_numpy()
+    command=Command()
+    command.deferred={model:deferred}
+    command.shard=shard
+    command._seed(seed)
+    command.fk_pool_size=int(options.get('fk_pool_size') or 0)
+    if options.get('stats',False): command.stats=GeneratorStats()
+    #the parent reports progress as shards complete
+    metrics=Metrics(model._meta.object_name,count)
+    try:
+        pks=command.populate(model,count,options,first_pk,metrics,row_offset)
+    except Exception, e:
+        transaction.rollback_unless_managed()
+        #the batches committed before the error are in the table, their keys go on to the later stages
+        pks=command.created
+        if pks is None: pks=key_array(model._meta.pk)
+        return model,pks,count-len(pks),metrics.queries,"%s: %s" % (e.__class__.__name__,e),None,row_offset
+    return model,pks,metrics.dropped,metrics.queries,None,command.stats and command.stats.entries,row_offset+count